@@ -0,0 +1,183 @@
+import cv2
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from decode import decode_full
+from detector import draw_detections
+from metrics import timed
+
+ANNOTATION_JPEG_QUALITY = int(os.environ.get('ANNOTATION_JPEG_QUALITY', 95))
+
+
+class Annotation:
+    # Upload asli + deteksi dalam koordinat resolusi penuh; piksel baru di-decode,
+    # digambar dan di-encode saat render() dipanggil
+
+    def __init__(self, file_bytes, full_size, bottles, extension='.jpg', frame=None):
+        self.file_bytes = file_bytes
+        self.full_size = tuple(full_size)
+        self.bottles = bottles
+        self.extension = extension
+        # Frame resolusi penuh yang sudah di-decode, kalau ada, supaya tidak decode dua kali
+        self.frame = frame if frame is not None and (frame.shape[1], frame.shape[0]) == self.full_size else None
+
+    @property
+    def content_type(self):
+        return 'image/png' if self.extension == '.png' else 'image/jpeg'
+
+    def render(self, quality=None):
+        frame, self.frame = self.frame, None
+        if frame is None:
+            with timed('decode_full'):
+                frame = decode_full(self.file_bytes)
+        with timed('annotate'):
+            draw_detections(frame, self.bottles)
+
+        params = []
+        if self.extension != '.png':
+            params = [cv2.IMWRITE_JPEG_QUALITY, int(quality or ANNOTATION_JPEG_QUALITY)]
+        with timed('encode'):
+            success, encoded = cv2.imencode(self.extension, frame, params)
+        if not success:
+            raise RuntimeError("Failed to encode annotated image")
+        return encoded.tobytes()
+
+
+def tmpfs_dir(name):
+    # Di /dev/shm (RAM) bila ada, supaya file sementara antar worker tidak menyentuh disk
+    if os.path.isdir('/dev/shm'):
+        return os.path.join('/dev/shm', 'sampahmas', name)
+    return name
+
+
+class AnnotationStore:
+    # Upload terbaru untuk /annotated/<id>. Satu entri = satu file (baris header JSON berisi
+    # deteksi, lalu upload-nya) supaya id dari worker mana pun bisa dilayani; default di tmpfs.
+    # Dibatasi total byte dan umur; thread latar scan ulang tiap check_interval detik supaya
+    # entri dari proses lain ikut terhitung
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, ttl=600.0, check_interval=1.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.used = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def _path(self, annotation_id):
+        # id datang dari URL; hanya uuid hex yang valid supaya tidak bisa keluar dari direktori
+        if len(annotation_id) != 32 or any(c not in '0123456789abcdef' for c in annotation_id):
+            return None
+        return os.path.join(self.directory, annotation_id)
+
+    def _scan(self):
+        entries = []
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.name.endswith('.part'):
+                # Sisa tulisan yang terputus (proses mati di tengah put)
+                if now - stat.st_mtime > self.ttl:
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+                continue
+            if self._path(entry.name) is None:
+                continue
+            entries.append((stat.st_mtime, entry.name, stat.st_size))
+        entries.sort()
+        return OrderedDict((name, (size, mtime)) for mtime, name, size in entries)
+
+    def _remove(self, annotation_id):
+        size, _ = self._entries.pop(annotation_id, (0, 0))
+        self.used -= size
+        try:
+            os.remove(os.path.join(self.directory, annotation_id))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        now = time.time()
+        while self._entries:
+            annotation_id, (_, mtime) = next(iter(self._entries.items()))
+            if self.used <= self.max_bytes and now - mtime <= self.ttl:
+                break
+            self._remove(annotation_id)
+
+    def collect(self):
+        # Scan di luar lock; entri yang ditulis selama scan berjalan tetap dipertahankan
+        started = time.time()
+        scanned = self._scan()
+        with self._lock:
+            for annotation_id, (size, mtime) in self._entries.items():
+                if annotation_id not in scanned and mtime >= started:
+                    scanned[annotation_id] = (size, mtime)
+            self._entries = scanned
+            self.used = sum(size for size, _ in scanned.values())
+            self._evict()
+
+    def _gc_loop(self):
+        while not self._stopping.wait(self.check_interval):
+            try:
+                self.collect()
+            except Exception as e:
+                logging.error(f"Error collecting annotations in {self.directory}: {str(e)}")
+
+    def start(self):
+        if self._thread is None:
+            self.collect()
+            self._thread = threading.Thread(target=self._gc_loop, name="AnnotationGC", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def put(self, file_bytes, full_size, bottles, extension='.jpg'):
+        # file_bytes boleh memoryview ke buffer upload; langsung ditulis ke file tanpa disalin
+        header = json.dumps({"full_size": [int(value) for value in full_size], "bottles": bottles, "extension": extension}).encode() + b"\n"
+        size = len(header) + len(file_bytes)
+        if size > self.max_bytes:
+            return None
+        annotation_id = uuid.uuid4().hex
+        path = os.path.join(self.directory, annotation_id)
+        with open(f"{path}.part", 'wb') as f:
+            f.write(header)
+            f.write(file_bytes)
+        os.replace(f"{path}.part", path)
+        with self._lock:
+            self._entries[annotation_id] = (size, time.time())
+            self.used += size
+            self._evict()
+        return annotation_id
+
+    def get(self, annotation_id):
+        path = self._path(annotation_id)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                if time.time() - os.fstat(f.fileno()).st_mtime > self.ttl:
+                    return None
+                meta = json.loads(f.readline())
+                data = f.read()
+        except (FileNotFoundError, ValueError):
+            return None
+        return Annotation(data, meta["full_size"], meta["bottles"], meta["extension"])
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.used, "max_bytes": self.max_bytes, "directory": self.directory}
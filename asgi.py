@@ -0,0 +1,235 @@
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from quart import Quart, Response, jsonify, request
+from werkzeug.utils import secure_filename
+
+import main
+from ingest import IngestError, PooledUpload
+from workers import QueueFullError
+
+# Entry point ASGI dengan kontrak /upload yang sama dengan main.py, mis.
+#   hypercorn asgi:app --bind 0.0.0.0:8000
+# Body dibaca di event loop, jadi koneksi mesin yang lambat tidak memegang thread. Decode +
+# inferensi di CPU executor kecil; Firebase dan API Node (library blocking) di I/O executor
+
+CPU_WORKERS = int(os.environ.get('ASYNC_CPU_WORKERS', os.cpu_count() or 1))
+IO_WORKERS = int(os.environ.get('ASYNC_IO_WORKERS', 8))
+# Request yang menunggu CPU executor; di atas ini langsung 503
+MAX_PENDING = int(os.environ.get('ASYNC_MAX_PENDING', 64))
+
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="AsyncCPU")
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="AsyncIO")
+
+app = Quart(__name__)
+app.config['MAX_CONTENT_LENGTH'] = main.app.config['MAX_CONTENT_LENGTH']
+app.config['BODY_TIMEOUT'] = int(os.environ.get('ASYNC_BODY_TIMEOUT', 120))
+app.config['RETRY_AFTER'] = main.app.config['RETRY_AFTER']
+
+_pending = 0
+_upload_tasks = set()
+
+
+async def run_cpu(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(cpu_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def run_io(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(io_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def upload_and_notify(job_id, annotation, reserved):
+    # Job upload sudah tercatat; di sini hanya dikerjakan dengan byte dari memori di I/O executor
+    await run_io(main.memory_upload_task, job_id, annotation, reserved)
+
+
+def dispatch_upload(loop, annotation, meta):
+    # Dipanggil dari CPU executor; task upload dijadwalkan di event loop
+    job_id = main.record_upload(annotation, meta)
+    size = main.upload_size_estimate(annotation)
+    if not main.upload_memory.try_reserve(size):
+        main.submit_job(job_id)
+        return
+
+    def start():
+        task = loop.create_task(upload_and_notify(job_id, annotation, size))
+        _upload_tasks.add(task)
+        task.add_done_callback(_upload_tasks.discard)
+
+    loop.call_soon_threadsafe(start)
+
+
+async def run_limited(fn, *args, **kwargs):
+    global _pending
+    if _pending >= MAX_PENDING:
+        raise QueueFullError(f"{_pending} requests already waiting for inference")
+    _pending += 1
+    try:
+        return await run_cpu(fn, *args, **kwargs)
+    finally:
+        _pending -= 1
+
+
+def handler_options():
+    root_path = request.root_path
+    return {
+        "dispatch_upload": functools.partial(dispatch_upload, asyncio.get_running_loop()),
+        "link": lambda annotation_id: f"{root_path}/annotated/{annotation_id}",
+    }
+
+
+async def detect(filename, file_bytes, machine_id):
+    return await run_limited(main.run_detection, filename, file_bytes, machine_id, **handler_options())
+
+
+@app.errorhandler(IngestError)
+async def handle_ingest_error(e):
+    return jsonify({"error": e.message}), e.status
+
+
+@app.errorhandler(QueueFullError)
+async def handle_queue_full(e):
+    logging.warning(f"Rejecting upload: {e}")
+    retry_after = app.config['RETRY_AFTER']
+    return jsonify({"error": "Server busy, try again later", "retry_after": retry_after}), 503, {'Retry-After': str(retry_after)}
+
+
+@app.before_serving
+async def warm_up():
+    main.start_warm_up()
+
+
+@app.after_serving
+async def drain_uploads():
+    if _upload_tasks:
+        await asyncio.wait(_upload_tasks, timeout=float(os.environ.get('UPLOAD_DRAIN_TIMEOUT', 25)))
+
+
+@app.route('/')
+async def home():
+    return main.home()
+
+
+def machine_id_from(form):
+    return (form.get('vending_machine_id') or request.args.get('vending_machine_id')
+            or request.headers.get('X-Vending-Machine-Id'))
+
+
+@app.route('/upload', methods=['POST'])
+async def upload_file():
+    files = await request.files
+    if 'imageFile' not in files:
+        return jsonify({"error": "No image file provided"}), 400
+
+    file = files['imageFile']
+    if file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
+
+    form = await request.form
+    body, status = await detect(secure_filename(file.filename), file.read(), machine_id_from(form))
+    return jsonify(body), status
+
+
+async def read_raw_upload():
+    # Body dibaca per chunk langsung ke buffer pool, dengan cek magic bytes/ukuran yang sama
+    limit = app.config['MAX_CONTENT_LENGTH']
+    if request.content_length is not None and request.content_length > limit:
+        raise IngestError(f"File too large, the limit is {limit} bytes", 413)
+    upload = PooledUpload(main.upload_buffers, limit, request.content_length)
+    try:
+        async for chunk in request.body:
+            upload.write(chunk)
+        upload.finish()
+    except BaseException:
+        upload.close()
+        raise
+    return upload
+
+
+def raw_filename(upload):
+    return request.args.get('filename') or request.headers.get('X-Filename') or f"upload{upload.image_type}"
+
+
+@app.route('/upload/raw', methods=['POST'])
+async def upload_raw():
+    upload = await read_raw_upload()
+    try:
+        body, status = await detect(secure_filename(raw_filename(upload)), upload.view(), machine_id_from({}))
+    finally:
+        upload.close()
+    return jsonify(body), status
+
+
+@app.route('/deposits', methods=['POST'])
+async def deposit_open():
+    body, status = main.open_deposit(machine_id_from(await request.form))
+    return jsonify(body), status
+
+
+@app.route('/deposits/<deposit_id>', methods=['GET'])
+async def deposit_status(deposit_id):
+    # Snapshot dari file deposit, tanpa menunggu session yang mungkin sedang inferensi
+    deposit = await run_io(main.deposits.get, deposit_id)
+    if deposit is None:
+        return jsonify({"error": "Deposit not found or expired"}), 404
+    return jsonify(deposit.summary())
+
+
+@app.route('/deposits/<deposit_id>/frames', methods=['POST'])
+async def deposit_frame(deposit_id):
+    if request.mimetype == 'multipart/form-data':
+        file = (await request.files).get('imageFile')
+        if file is None or file.filename == '':
+            return jsonify({"error": "No image file provided"}), 400
+        body, status = await run_limited(main.add_deposit_frame, deposit_id, secure_filename(file.filename), file.read())
+        return jsonify(body), status
+
+    upload = await read_raw_upload()
+    try:
+        body, status = await run_limited(main.add_deposit_frame, deposit_id, secure_filename(raw_filename(upload)), upload.view())
+    finally:
+        upload.close()
+    return jsonify(body), status
+
+
+@app.route('/deposits/<deposit_id>/close', methods=['POST'])
+async def deposit_close(deposit_id):
+    body, status = await run_cpu(main.close_deposit, deposit_id, **handler_options())
+    return jsonify(body), status
+
+
+@app.route('/annotated/<annotation_id>')
+async def annotated_image(annotation_id):
+    annotation = main.annotations.get(annotation_id)
+    if annotation is None:
+        return jsonify({"error": "Annotation not found or expired"}), 404
+    quality = request.args.get('quality', type=int)
+    if quality is not None:
+        quality = min(100, max(1, quality))
+    return Response(await run_cpu(annotation.render, quality), mimetype=annotation.content_type)
+
+
+@app.route('/ready')
+async def ready():
+    body, status = main.readiness()
+    return jsonify(body), status
+
+
+@app.route('/stats')
+async def stats():
+    snapshot = await run_io(main.stats_snapshot)
+    snapshot["async"] = {
+        "pending": _pending,
+        "upload_tasks": len(_upload_tasks),
+        "cpu_workers": CPU_WORKERS,
+        "io_workers": IO_WORKERS,
+    }
+    return jsonify(snapshot)
+
+
+@app.route('/metrics')
+async def metrics_endpoint():
+    return Response(main.metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,196 @@
+import cv2
+import numpy as np
+import logging
+import os
+import threading
+import time
+
+from model import INPUT_SIZE, MEAN, SCALE_FACTOR, registry
+
+ONNX_MODEL_PATH = os.environ.get('ONNX_MODEL_PATH', 'MobileNetSSD_deploy.onnx')
+INT8_MODEL_PATH = os.environ.get('INT8_MODEL_PATH', 'MobileNetSSD_deploy.int8.onnx')
+
+
+class InferenceBackend:
+    # Input: blob NCHW dari blobFromImage(s). Output: baris DetectionOutput SSD 1x1xNx7,
+    # [image_id, class_id, confidence, x1, y1, x2, y2] dengan box ternormalisasi
+    name = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.warmup_time = None
+        self.calls = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _forward(self, blob):
+        raise NotImplementedError
+
+    def load(self):
+        if self.warmup_time is not None:
+            return
+        with self._lock:
+            if self.warmup_time is not None:
+                return
+            start_time = time.perf_counter()
+            self._load()
+            dummy = np.zeros((INPUT_SIZE[1], INPUT_SIZE[0], 3), np.uint8)
+            self._forward(cv2.dnn.blobFromImage(dummy, SCALE_FACTOR, INPUT_SIZE, MEAN))
+            self.warmup_time = time.perf_counter() - start_time
+        logging.info(f"Inference backend '{self.name}' warmed up in {self.warmup_time:.4f} seconds")
+
+    def forward(self, blob):
+        self.load()
+        start_time = time.perf_counter()
+        detections = self._forward(blob)
+        latency = time.perf_counter() - start_time
+        with self._lock:
+            self.calls += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+        return detections
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": self.name,
+                "warmup_time": self.warmup_time,
+                "calls": self.calls,
+                "mean_latency": self.total_latency / self.calls if self.calls else 0,
+                "max_latency": self.max_latency,
+            }
+
+
+class OpenCVBackend(InferenceBackend):
+    name = 'opencv'
+
+    def __init__(self, model_registry=registry):
+        super().__init__()
+        self.registry = model_registry
+
+    def _load(self):
+        self.registry.load()
+
+    def _forward(self, blob):
+        with self.registry.acquire() as net:
+            net.setInput(blob)
+            return net.forward()
+
+    def stats(self):
+        stats = super().stats()
+        stats["model"] = self.registry.stats()
+        return stats
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    # Menerima export dengan layer DetectionOutput ([1, 1, N, 7]) atau export mentah per prior
+    # (scores [B, P, classes], boxes [B, P, 4]); yang mentah di-decode + NMS per kelas di sini
+    name = 'onnxruntime'
+
+    def __init__(self, model_path=ONNX_MODEL_PATH, threads=0, score_threshold=0.01, nms_threshold=0.45, top_k=100):
+        super().__init__()
+        self.model_path = model_path
+        self.threads = threads
+        self.score_threshold = score_threshold
+        self.nms_threshold = nms_threshold
+        self.top_k = top_k
+        self.session = None
+
+    def _load(self):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError(f"The '{self.name}' backend requires onnxruntime (pip install onnxruntime)")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        self.session = ort.InferenceSession(self.model_path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def _forward(self, blob):
+        # InferenceSession.run thread-safe, satu session untuk semua thread
+        outputs = self.session.run(None, {self.input_name: blob.astype(np.float32)})
+        if len(outputs) == 1 and outputs[0].shape[-1] == 7:
+            return outputs[0].reshape(1, 1, -1, 7)
+
+        scores, boxes = outputs[0], outputs[1]
+        if scores.shape[-1] == 4:
+            scores, boxes = boxes, scores
+        return self._decode(scores, boxes)
+
+    def _decode(self, scores, boxes):
+        rows = []
+        for image_id in range(scores.shape[0]):
+            # Kolom 0 = kelas background
+            class_ids = scores[image_id, :, 1:].argmax(axis=1) + 1
+            confidences = scores[image_id, np.arange(scores.shape[1]), class_ids]
+            keep = confidences > self.score_threshold
+            if not np.any(keep):
+                continue
+            class_ids, confidences, image_boxes = class_ids[keep], confidences[keep], boxes[image_id][keep]
+            xywh = np.column_stack((image_boxes[:, :2], image_boxes[:, 2:] - image_boxes[:, :2]))
+            indices = cv2.dnn.NMSBoxesBatched(
+                xywh.tolist(), confidences.tolist(), class_ids.tolist(),
+                self.score_threshold, self.nms_threshold, top_k=self.top_k,
+            )
+            for i in np.array(indices, dtype=int).flatten():
+                rows.append([image_id, class_ids[i], confidences[i], *image_boxes[i]])
+
+        if not rows:
+            return np.zeros((1, 1, 0, 7), np.float32)
+        return np.array(rows, np.float32).reshape(1, 1, -1, 7)
+
+
+class Int8Backend(OnnxRuntimeBackend):
+    # Runtime yang sama dengan model hasil kuantisasi statis (lihat quantize_model)
+    name = 'int8'
+
+    def __init__(self, model_path=INT8_MODEL_PATH, **kwargs):
+        super().__init__(model_path=model_path, **kwargs)
+
+
+def quantize_model(fp32_path, int8_path, calibration_images):
+    # Buat model INT8 untuk Int8Backend dari export ONNX FP32; beberapa frame chute (BGR)
+    # dipakai sebagai data kalibrasi
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    import onnxruntime as ort
+
+    input_name = ort.InferenceSession(fp32_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self._frames = iter(calibration_images)
+
+        def get_next(self):
+            frame = next(self._frames, None)
+            if frame is None:
+                return None
+            blob = cv2.dnn.blobFromImage(cv2.resize(frame, INPUT_SIZE), SCALE_FACTOR, INPUT_SIZE, MEAN)
+            return {input_name: blob}
+
+    quantize_static(fp32_path, int8_path, Reader(), quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    logging.info(f"Quantized model written to {int8_path}")
+
+
+BACKENDS = {
+    OpenCVBackend.name: OpenCVBackend,
+    OnnxRuntimeBackend.name: OnnxRuntimeBackend,
+    Int8Backend.name: Int8Backend,
+}
+
+
+def create_backend(name):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}', expected one of: {', '.join(BACKENDS)}")
+    if name == OpenCVBackend.name:
+        return OpenCVBackend()
+    return BACKENDS[name](threads=int(os.environ.get('ONNX_THREADS', 0)))
+
+
+backend = create_backend(os.environ.get('INFERENCE_BACKEND', OpenCVBackend.name))
@@ -0,0 +1,109 @@
+import cv2
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from model import INPUT_SIZE, MEAN, SCALE_FACTOR
+from backends import backend as default_backend
+
+
+def forward_batch(backend, images):
+    # Satu forward pass untuk beberapa gambar (sudah di-resize); hasil per gambar + waktu inferensi
+    blob = cv2.dnn.blobFromImages(images, SCALE_FACTOR, INPUT_SIZE, MEAN)
+    start_time = time.perf_counter()
+    detections = backend.forward(blob)
+    inference_time = time.perf_counter() - start_time
+
+    # Kolom 0 tiap baris deteksi SSD = indeks gambar di dalam batch
+    image_ids = detections[0, 0, :, 0].astype(int)
+    return [detections[:, :, image_ids == i, :] for i in range(len(images))], inference_time
+
+
+class _Request:
+    __slots__ = ('image', 'future')
+
+    def __init__(self, image):
+        self.image = image
+        self.future = Future()
+
+
+class MicroBatcher:
+    # Mengumpulkan gambar dari beberapa thread request jadi satu batch NCHW. Batch dikirim
+    # begitu ada max_batch_size gambar atau max_wait_ms sejak gambar pertama, mana yang duluan
+
+    def __init__(self, backend=default_backend, max_batch_size=8, max_wait_ms=10, workers=1):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.images = 0
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"MicroBatcher-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, image):
+        # image harus sudah di-resize ke ukuran input network
+        self._ensure_started()
+        request = _Request(image)
+        self._queue.put(request)
+        return request.future
+
+    def infer(self, image, timeout=None):
+        return self.submit(image).result(timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._process(batch)
+            except Exception as e:
+                logging.error(f"Error running inference batch: {str(e)}")
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+    def _process(self, batch):
+        results, inference_time = forward_batch(self.backend, [request.image for request in batch])
+
+        with self._lock:
+            self.batches += 1
+            self.images += len(batch)
+
+        for request, detections in zip(batch, results):
+            request.future.set_result((detections, inference_time))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "images": self.images,
+                "mean_batch_size": self.images / self.batches if self.batches else 0,
+                "pending": self._queue.qsize(),
+            }
@@ -0,0 +1,97 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark.stubs import start_node_api_stub
+from benchmark.pipeline import load_corpus, run_pipeline
+from benchmark.load import http_sender, in_process_sender, run_load
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the detection pipeline and the /upload endpoint")
+    parser.add_argument('--images', help="directory of sample PNG/JPEG images")
+    parser.add_argument('--synthetic', type=int, default=0, help="number of generated 1080p JPEGs to add to the corpus")
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--concurrency', default='1,4,16', help="comma-separated load-test concurrency levels, empty to skip")
+    parser.add_argument('--requests', type=int, default=100, help="requests per concurrency level")
+    parser.add_argument('--url', help="benchmark a running server instead of an in-process app with stubbed upstreams")
+    parser.add_argument('--output', default='bench_output.json')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    images = load_corpus(args.images, args.synthetic)
+    if not images:
+        parser.error("no images: pass --images and/or --synthetic")
+
+    node_stub = None
+    if not args.url:
+        # Upstreams diganti stub lokal supaya hasil benchmark tidak bergantung ke Firebase/devtunnel
+        # Upload ditulis ke LocalBucket di direktori sementara, bukan ke Firebase
+        workdir = tempfile.mkdtemp(prefix='sampahmas-bench-')
+        os.environ['FIREBASE_LOCAL_BUCKET'] = os.path.join(workdir, 'bucket')
+        node_stub, node_url = start_node_api_stub()
+        os.environ['NODE_API_URL'] = node_url
+        os.environ.setdefault('JOB_QUEUE_PATH', os.path.join(workdir, 'jobs.db'))
+        os.environ.setdefault('SPOOL_DIR', os.path.join(workdir, 'spool'))
+        os.environ.setdefault('ANNOTATION_DIR', os.path.join(workdir, 'annotations'))
+        # Korpus dikirim berulang; dengan cache hasil aktif semua request setelah putaran pertama hanya cache hit
+        os.environ['RESULT_CACHE_SIZE'] = '0'
+
+    from backends import backend
+    import cv2
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            "revision": git_revision(),
+            "backend": backend.name,
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "cpu_count": os.cpu_count(),
+            "images": [name for name, _ in images],
+        },
+        "pipeline": run_pipeline(images, backend, args.iterations, args.warmup),
+        "load": [],
+    }
+
+    levels = [int(level) for level in args.concurrency.split(',') if level.strip()]
+    if levels:
+        if args.url:
+            send = http_sender(args.url)
+        else:
+            import main as server
+            send = in_process_sender(server.app)
+        for concurrency in levels:
+            results["load"].append(run_load(images, send, concurrency, args.requests))
+        if node_stub is not None:
+            results["meta"]["node_api_stub_requests"] = node_stub.received
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    pipeline = results["pipeline"]
+    print(f"pipeline: {pipeline['images_per_sec']:.1f} images/sec, "
+          f"forward p50 {pipeline['stages']['forward']['p50_ms']:.2f} ms")
+    for level in results["load"]:
+        print(f"concurrency {level['concurrency']}: {level['requests_per_sec']:.1f} req/sec, "
+              f"p95 {level['latency']['p95_ms']:.2f} ms, statuses {level['statuses']}")
+    print(f"results written to {args.output}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import io
+import threading
+import time
+
+from benchmark.stats import summarize
+
+
+def in_process_sender(app):
+    local = threading.local()
+
+    def send(name, file_bytes):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        response = client.post('/upload', data={'imageFile': (io.BytesIO(file_bytes), name)})
+        return response.status_code
+
+    return send
+
+
+def http_sender(url):
+    import requests
+
+    local = threading.local()
+
+    def send(name, file_bytes):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        response = session.post(url, files={'imageFile': (name, file_bytes)}, timeout=60)
+        return response.status_code
+
+    return send
+
+
+def run_load(images, send, concurrency, total_requests):
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    counter = iter(range(total_requests))
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            name, file_bytes = images[i % len(images)]
+            # Byte unik setelah akhir gambar: decoder mengabaikannya, tapi cache hasil
+            # di server (--url) tidak bisa menjawab dari putaran korpus sebelumnya
+            file_bytes = file_bytes + f"benchmark-{i}".encode()
+            start_time = time.perf_counter()
+            try:
+                status = send(name, file_bytes)
+            except Exception as e:
+                status = type(e).__name__
+            latency = time.perf_counter() - start_time
+            with lock:
+                latencies.append(latency)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "statuses": statuses,
+        "requests_per_sec": total_requests / elapsed if elapsed else 0,
+        "latency": summarize(latencies),
+    }
@@ -0,0 +1,76 @@
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from model import INPUT_SIZE, MEAN, SCALE_FACTOR
+from benchmark.stats import summarize
+
+STAGES = ('decode', 'resize', 'blob', 'forward', 'postprocess', 'annotate', 'encode')
+
+
+def load_corpus(directory=None, synthetic=0, size=(1920, 1080)):
+    # Byte mentah semua PNG/JPEG di directory, plus `synthetic` JPEG buatan dengan resolusi kamera itu
+    images = []
+    if directory:
+        for pattern in ('*.jpg', '*.jpeg', '*.png'):
+            for path in sorted(glob.glob(os.path.join(directory, pattern))):
+                with open(path, 'rb') as f:
+                    images.append((os.path.basename(path), f.read()))
+    rng = np.random.default_rng(0)
+    for i in range(synthetic):
+        frame = cv2.GaussianBlur(rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8), (15, 15), 0)
+        images.append((f"synthetic_{i}.jpg", cv2.imencode('.jpg', frame)[1].tobytes()))
+    return images
+
+
+def run_pipeline(images, backend, iterations=10, warmup=2):
+    from annotations import ANNOTATION_JPEG_QUALITY
+    from decode import decode_for_inference, decode_full
+    from detector import draw_detections, filter_detections
+
+    timings = {stage: [] for stage in STAGES}
+    timings['total'] = []
+
+    def one(file_bytes):
+        t0 = time.perf_counter()
+        frame, full_size = decode_for_inference(file_bytes)
+        t1 = time.perf_counter()
+        resized = cv2.resize(frame, INPUT_SIZE)
+        t2 = time.perf_counter()
+        blob = cv2.dnn.blobFromImage(resized, SCALE_FACTOR, INPUT_SIZE, MEAN)
+        t3 = time.perf_counter()
+        detections = backend.forward(blob)
+        t4 = time.perf_counter()
+        objects = filter_detections(detections, full_size[0], full_size[1])
+        t5 = time.perf_counter()
+        # Sama seperti upload worker produksi: frame resolusi penuh hanya di-decode untuk digambari
+        if (frame.shape[1], frame.shape[0]) != tuple(full_size):
+            frame = decode_full(file_bytes)
+        draw_detections(frame, objects)
+        t6 = time.perf_counter()
+        cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, ANNOTATION_JPEG_QUALITY])
+        t7 = time.perf_counter()
+        return (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4, t6 - t5, t7 - t6, t7 - t0)
+
+    backend.load()
+    for _ in range(warmup):
+        for _, file_bytes in images:
+            one(file_bytes)
+
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        for _, file_bytes in images:
+            for stage, value in zip(STAGES + ('total',), one(file_bytes)):
+                timings[stage].append(value)
+    elapsed = time.perf_counter() - start_time
+
+    processed = iterations * len(images)
+    return {
+        "images": len(images),
+        "iterations": iterations,
+        "images_per_sec": processed / elapsed if elapsed else 0,
+        "stages": {stage: summarize(values) for stage, values in timings.items()},
+    }
@@ -0,0 +1,16 @@
+import numpy as np
+
+
+def summarize(samples):
+    # Sampel latensi dalam detik -> persentil dalam milidetik
+    if not samples:
+        return {"count": 0}
+    values = np.array(samples) * 1000.0
+    return {
+        "count": len(samples),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+    }
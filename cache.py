@@ -0,0 +1,101 @@
+import cv2
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def content_hash(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def perceptual_hash(frame, hash_size=8):
+    # dHash: bandingkan piksel bertetangga di thumbnail grayscale kecil, supaya frame yang sama
+    # meski di-encode ulang atau exposure sedikit beda tetap cocok
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(''.join('1' if bit else '0' for bit in bits), 2)
+
+
+class ResultCache:
+    # Cache LRU + TTL untuk hasil deteksi, kunci = hash isi upload. Dengan perceptual matching,
+    # indeks dHash kedua cocok dalam max_distance bit; indeks itu dipisah per scope (mesin dan ROI)
+    # supaya frame mirip tidak mendapat hasil milik mesin lain
+
+    def __init__(self, max_entries=1024, ttl=300.0, perceptual=False, max_distance=4):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.perceptual = perceptual
+        self.max_distance = max_distance
+        self._entries = OrderedDict()
+        self._phashes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.perceptual_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expired(self, entry, now):
+        return now - entry[1] > self.ttl
+
+    def _remove(self, key):
+        value, created, index = self._entries.pop(key)
+        if index is not None and self._phashes.get(index) == key:
+            del self._phashes[index]
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry, now):
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get_similar(self, phash, scope=None):
+        if not self.perceptual:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            for (candidate_scope, candidate), key in list(self._phashes.items()):
+                if candidate_scope != scope or bin(candidate ^ phash).count('1') > self.max_distance:
+                    continue
+                entry = self._entries.get(key)
+                if entry is None or self._expired(entry, now):
+                    continue
+                self._entries.move_to_end(key)
+                self.perceptual_hits += 1
+                return entry[0]
+            return None
+
+    def put(self, key, value, phash=None, scope=None):
+        # put selalu didahului lookup yang gagal, jadi dihitung sebagai miss
+        now = time.monotonic()
+        index = (scope, phash) if phash is not None and self.perceptual else None
+        with self._lock:
+            self.misses += 1
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, now, index)
+            if index is not None:
+                self._phashes[index] = key
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.perceptual_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "perceptual_hits": self.perceptual_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.perceptual_hits) / lookups if lookups else 0,
+            }
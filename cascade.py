@@ -0,0 +1,149 @@
+import cv2
+import logging
+import numpy as np
+import os
+import threading
+import time
+
+from metrics import metrics
+
+CASCADE_REFERENCE_DIR = os.environ.get('CASCADE_REFERENCE_DIR', 'cascade_references')
+
+cascade_frames = metrics.counter('sampahmas_cascade_frames_total', "Frames seen by each cascade stage, by outcome")
+
+
+class EmptyChuteGate:
+    # Tahap pertama cascade. Kamera tiap mesin melihat chute yang tetap, jadi frame kosong mirip
+    # frame kosong sebelumnya: thumbnail grayscale kecil (blur, kecerahan dinormalisasi) dibanding
+    # dengan referensi per mesin. Selisihnya = rata-rata selisih absolut (0-255) blok block x block
+    # yang paling berbeda, supaya objek kecil tidak hilang dirata-rata; kalau <= threshold, SSD dilewati.
+    # Referensi dipelajari dari frame yang kosong menurut SSD (rata-rata berjalan, mengikuti perubahan
+    # cahaya) dan baru dipakai setelah min_samples frame. Satu file per mesin di `directory`, dibagi
+    # antar proses; perubahan dari proses lain terlihat dalam check_interval detik
+
+    def __init__(self, threshold=6.0, size=(48, 36), block=6, learn_rate=0.2, min_samples=3,
+                 directory=CASCADE_REFERENCE_DIR, check_interval=1.0):
+        if size[0] % block or size[1] % block:
+            raise ValueError(f"Thumbnail size {size} must be a multiple of the block size {block}")
+        self.threshold = threshold
+        self.size = size
+        self.block = block
+        self.learn_rate = learn_rate
+        self.min_samples = min_samples
+        self.directory = directory
+        self.check_interval = check_interval
+        # machine_id -> [thumb, samples, mtime, checked]
+        self._references = {}
+        self._lock = threading.Lock()
+        self.counts = {"rejected": 0, "passed": 0, "no_reference": 0}
+
+    def thumbnail(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        small = cv2.resize(gray, self.size, interpolation=cv2.INTER_AREA).astype(np.float32)
+        small = cv2.GaussianBlur(small, (3, 3), 0)
+        return small - small.mean()
+
+    def difference(self, thumb, reference):
+        # INTER_AREA dengan faktor bulat = rata-rata tiap blok
+        blocks = (self.size[0] // self.block, self.size[1] // self.block)
+        return float(cv2.resize(np.abs(thumb - reference), blocks, interpolation=cv2.INTER_AREA).max())
+
+    def _path(self, machine_id):
+        return os.path.join(self.directory, str(machine_id).encode('utf-8').hex() + '.npz')
+
+    def _reference(self, machine_id, force=False):
+        # (thumb, samples, ...) dari cache, dibaca ulang kalau file berubah; lock harus dipegang
+        now = time.monotonic()
+        entry = self._references.get(machine_id)
+        if entry is not None and not force and now - entry[3] < self.check_interval:
+            return entry
+        path = self._path(machine_id)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if entry is None or mtime != entry[2]:
+            thumb, samples = None, 0
+            if mtime is not None:
+                try:
+                    with np.load(path) as data:
+                        thumb, samples = data['thumb'], int(data['samples'])
+                except (OSError, ValueError, KeyError) as e:
+                    logging.error(f"Ignoring invalid cascade reference {path}: {e}")
+            entry = [thumb, samples, mtime, now]
+            self._references[machine_id] = entry
+        else:
+            entry[3] = now
+        return entry
+
+    def _store(self, machine_id, thumb, samples):
+        # lock harus dipegang
+        path = self._path(machine_id)
+        mtime = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, thumb=thumb, samples=samples)
+            os.replace(tmp_path, path)
+            mtime = os.stat(path).st_mtime_ns
+        except OSError as e:
+            logging.error(f"Failed to save cascade reference {path}: {e}")
+        self._references[machine_id] = [thumb, samples, mtime, time.monotonic()]
+
+    def _count(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+        cascade_frames.inc(stage='empty_chute', result=outcome)
+
+    def check(self, machine_id, frame):
+        # (empty, thumbnail); thumbnail diteruskan ke learn()
+        thumb = self.thumbnail(frame)
+        with self._lock:
+            entry = self._reference(machine_id)
+        if entry[0] is None or entry[1] < self.min_samples:
+            self._count("no_reference")
+            return False, thumb
+        if self.difference(thumb, entry[0]) <= self.threshold:
+            self._count("rejected")
+            return True, thumb
+        self._count("passed")
+        return False, thumb
+
+    def learn(self, machine_id, thumb):
+        with self._lock:
+            reference, samples = self._reference(machine_id, force=True)[:2]
+            if reference is None:
+                self._store(machine_id, thumb, 1)
+            else:
+                self._store(machine_id, cv2.addWeighted(reference, 1 - self.learn_rate, thumb, self.learn_rate, 0), samples + 1)
+
+    def set_reference(self, machine_id, frame):
+        with self._lock:
+            self._store(machine_id, self.thumbnail(frame), self.min_samples)
+
+    def reset(self, machine_id):
+        with self._lock:
+            self._references.pop(machine_id, None)
+            try:
+                os.remove(self._path(machine_id))
+            except FileNotFoundError:
+                return False
+            return True
+
+    def machines(self):
+        try:
+            return sum(1 for name in os.listdir(self.directory) if name.endswith('.npz'))
+        except FileNotFoundError:
+            return 0
+
+    def stats(self):
+        with self._lock:
+            checked = sum(self.counts.values())
+            return {
+                **self.counts,
+                "reject_rate": self.counts["rejected"] / checked if checked else 0,
+                "machines": self.machines(),
+                "threshold": self.threshold,
+                "block": self.block,
+            }
@@ -0,0 +1,104 @@
+import cv2
+import numpy as np
+import os
+import struct
+
+# Sisi terpendek minimal frame hasil decode; SSD hanya melihat 300x300
+DECODE_MIN_SIDE = int(os.environ.get('DECODE_MIN_SIDE', 300))
+
+REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+# Marker start-of-frame JPEG yang memuat ukuran gambar
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def is_jpeg(data):
+    return data[:3] == b'\xff\xd8\xff'
+
+
+def is_png(data):
+    return data[:8] == b'\x89PNG\r\n\x1a\n'
+
+
+def sniff_image_type(data):
+    # Ekstensi sesuai signature file, None untuk format lain
+    if is_jpeg(data):
+        return '.jpg'
+    if is_png(data):
+        return '.png'
+    return None
+
+
+def _jpeg_size(data):
+    i = 2
+    length = len(data)
+    while i + 4 <= length:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        segment_length = struct.unpack('>H', data[i + 2:i + 4])[0]
+        if marker in _SOF_MARKERS:
+            if i + 9 > length:
+                return None
+            height, width = struct.unpack('>HH', data[i + 5:i + 9])
+            return width, height
+        i += 2 + segment_length
+    return None
+
+
+def image_size(data):
+    # Baca (width, height) dari header PNG/JPEG tanpa decode piksel
+    if is_png(data) and len(data) >= 24:
+        return struct.unpack('>II', data[16:24])
+    if is_jpeg(data):
+        return _jpeg_size(data)
+    return None
+
+
+def reduction_factor(size, min_side=DECODE_MIN_SIDE, region=(1.0, 1.0)):
+    # region = (lebar, tinggi) bagian frame yang jadi satu input SSD, sebagai pecahan; sisi
+    # terpendeknya dijaga >= min_side. EXIF bisa menukar lebar/tinggi, jadi ambil yang terkecil
+    if size is None:
+        return 1
+    width, height = size
+    shortest = min(width * region[0], height * region[1], height * region[0], width * region[1])
+    for factor, _ in REDUCED_FLAGS:
+        if shortest // factor >= min_side:
+            return factor
+    return 1
+
+
+def decode_full(data):
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def decode_for_inference(data, min_side=DECODE_MIN_SIDE, region=(1.0, 1.0)):
+    # JPEG di-decode pada skala 1/2, 1/4 atau 1/8 (DCT scaling libjpeg) selama sisi terpendek
+    # `region` tetap >= min_side. Ukuran penuh ikut dikembalikan untuk memetakan balik deteksi
+    size = image_size(data) if is_jpeg(data) else None
+    factor = reduction_factor(size, min_side, region)
+    if factor == 1:
+        frame = decode_full(data)
+        if frame is None:
+            return None, None
+        return frame, (frame.shape[1], frame.shape[0])
+
+    flag = dict(REDUCED_FLAGS)[factor]
+    frame = cv2.imdecode(np.frombuffer(data, np.uint8), flag)
+    if frame is None:
+        return None, None
+    width, height = size
+    # Orientasi EXIF bisa memutar frame hasil decode dibanding ukuran di header
+    if (frame.shape[1] > frame.shape[0]) != (width > height):
+        width, height = height, width
+    return frame, (width, height)
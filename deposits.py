@@ -0,0 +1,318 @@
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from workers import QueueFullError
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    intersection = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+class Track:
+    # Satu objek yang diikuti di sepanjang frame satu deposit
+    def __init__(self, bottle):
+        self.box = list(bottle["box"])
+        self.hits = 1
+        self.max_confidence = bottle["confidence"]
+        self.total_confidence = bottle["confidence"]
+
+    def update(self, bottle):
+        self.box = list(bottle["box"])
+        self.hits += 1
+        self.max_confidence = max(self.max_confidence, bottle["confidence"])
+        self.total_confidence += bottle["confidence"]
+
+    def state(self):
+        return {"box": self.box, "hits": self.hits, "max_confidence": self.max_confidence, "total_confidence": self.total_confidence}
+
+    @classmethod
+    def from_state(cls, state):
+        track = cls({"box": state["box"], "confidence": state["max_confidence"]})
+        track.hits = state["hits"]
+        track.total_confidence = state["total_confidence"]
+        return track
+
+    def as_dict(self):
+        return {
+            "box": self.box,
+            "hits": self.hits,
+            "max_confidence": int(self.max_confidence * 100),
+            "mean_confidence": int(self.total_confidence / self.hits * 100),
+        }
+
+
+class Deposit:
+    # Frame-frame satu deposit. Deteksi dicocokkan ke track lewat IoU; begitu satu track terlihat
+    # di `consensus` frame, deposit diputuskan botol dan frame berikutnya tidak diinferensi. Frame
+    # kosong tidak menutup lebih awal (botol mungkin masih meluncur); tanpa konsensus diputuskan
+    # mayoritas setelah max_frames. Hanya frame botol terbaik dan frame kosong terakhir disimpan
+
+    def __init__(self, machine_id=None, consensus=2, max_frames=5, iou_threshold=0.3):
+        self.id = uuid.uuid4().hex
+        self.machine_id = machine_id
+        self.consensus = consensus
+        self.max_frames = max_frames
+        self.iou_threshold = iou_threshold
+        self.tracks = []
+        self.frames = 0
+        self.inferred = 0
+        self.skipped = 0
+        self.empty_frames = 0
+        # (frame_info, bottles) dan frame_info; byte frame None kalau hanya ada di file DepositStore
+        self.best = None
+        self.last_empty = None
+        self.inference_time = 0.0
+        self.closed = False
+        self.opened = time.time()
+        # Frame yang berubah sejak deposit dimuat, untuk ditulis DepositStore
+        self.changed = set()
+
+    @property
+    def verdict(self):
+        # True/False kalau sudah diputuskan, None selama frame masih berpengaruh
+        if any(track.hits >= self.consensus for track in self.tracks):
+            return True
+        if self.inferred >= self.max_frames:
+            return self.final_verdict()
+        return None
+
+    def final_verdict(self):
+        # Tanpa konsensus: mayoritas frame yang diinferensi
+        return self.inferred - self.empty_frames > self.empty_frames
+
+    def skip(self):
+        self.frames += 1
+        self.skipped += 1
+
+    def add(self, frame_info, bottle_found, inference_time, bottles):
+        # frame_info: (filename, file_bytes, full_size), disimpan untuk upload saat deposit ditutup
+        self.frames += 1
+        self.inferred += 1
+        self.inference_time += inference_time
+        if not bottle_found:
+            self.empty_frames += 1
+            self.last_empty = frame_info
+            self.changed.add('last_empty')
+            return
+
+        unmatched = list(self.tracks)
+        for bottle in sorted(bottles, key=lambda bottle: -bottle["confidence"]):
+            match = max(unmatched, key=lambda track: iou(track.box, bottle["box"]), default=None)
+            if match is not None and iou(match.box, bottle["box"]) >= self.iou_threshold:
+                match.update(bottle)
+                unmatched.remove(match)
+            else:
+                self.tracks.append(Track(bottle))
+        top = bottles[0]["confidence"]
+        if self.best is None or top > self.best[1][0]["confidence"]:
+            self.best = (frame_info, bottles)
+            self.changed.add('best')
+
+    def state(self):
+        # Semua kecuali byte frame, sebagai JSON
+        def frame_state(frame_info):
+            filename, _, full_size = frame_info
+            return {"filename": filename, "full_size": [int(value) for value in full_size]}
+
+        return {
+            "id": self.id,
+            "machine_id": self.machine_id,
+            "consensus": self.consensus,
+            "max_frames": self.max_frames,
+            "iou_threshold": self.iou_threshold,
+            "tracks": [track.state() for track in self.tracks],
+            "frames": self.frames,
+            "inferred": self.inferred,
+            "skipped": self.skipped,
+            "empty_frames": self.empty_frames,
+            "best": None if self.best is None else {**frame_state(self.best[0]), "bottles": self.best[1]},
+            "last_empty": None if self.last_empty is None else frame_state(self.last_empty),
+            "inference_time": self.inference_time,
+            "opened": self.opened,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        deposit = cls(state["machine_id"], state["consensus"], state["max_frames"], state["iou_threshold"])
+        deposit.id = state["id"]
+        deposit.tracks = [Track.from_state(track) for track in state["tracks"]]
+        for key in ("frames", "inferred", "skipped", "empty_frames", "inference_time", "opened"):
+            setattr(deposit, key, state[key])
+        best, last_empty = state["best"], state["last_empty"]
+        if best is not None:
+            deposit.best = ((best["filename"], None, tuple(best["full_size"])), best["bottles"])
+        if last_empty is not None:
+            deposit.last_empty = (last_empty["filename"], None, tuple(last_empty["full_size"]))
+        return deposit
+
+    def summary(self):
+        return {
+            "deposit_id": self.id,
+            "frames": self.frames,
+            "inferred": self.inferred,
+            "skipped": self.skipped,
+            "decided": self.verdict is not None,
+            "bottle_found": self.verdict,
+            "tracks": [track.as_dict() for track in self.tracks],
+            "age": time.time() - self.opened,
+        }
+
+
+class DepositStore:
+    # Deposit terbuka, satu direktori per deposit (state.json + frame yang disimpan), supaya frame
+    # dan close bisa masuk ke worker mana pun. Request memakai session(), yang memegang flock.
+    # Deposit tanpa frame/close dalam ttl detik dibuang tanpa upload; pembersihan berjalan saat
+    # deposit dibuka, paling sering tiap check_interval detik
+
+    def __init__(self, directory, ttl=60.0, max_open=1000, check_interval=1.0, **deposit_options):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_open = max_open
+        self.check_interval = check_interval
+        self.deposit_options = deposit_options
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self.opened = 0
+        self.closed = 0
+        self.expired = 0
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def _path(self, deposit_id):
+        # id datang dari URL; hanya uuid hex yang valid supaya tidak bisa keluar dari direktori
+        if len(deposit_id) != 32 or any(c not in '0123456789abcdef' for c in deposit_id):
+            return None
+        return os.path.join(self.directory, deposit_id)
+
+    def _load(self, path):
+        try:
+            with open(os.path.join(path, 'state.json')) as f:
+                if time.time() - os.fstat(f.fileno()).st_mtime >= self.ttl:
+                    return None
+                return Deposit.from_state(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError) as e:
+            logging.error(f"Ignoring invalid deposit state in {path}: {e}")
+            return None
+
+    def _save(self, path, deposit):
+        # Frame dulu, baru state.json yang merujuknya; keduanya lewat rename
+        for slot in deposit.changed:
+            frame_info = deposit.best[0] if slot == 'best' else deposit.last_empty
+            with open(os.path.join(path, f"{slot}.part"), 'wb') as f:
+                f.write(frame_info[1])
+            os.replace(os.path.join(path, f"{slot}.part"), os.path.join(path, slot))
+        deposit.changed.clear()
+        with open(os.path.join(path, 'state.part'), 'w') as f:
+            json.dump(deposit.state(), f)
+        os.replace(os.path.join(path, 'state.part'), os.path.join(path, 'state.json'))
+
+    def _count(self):
+        # Menghapus deposit yang kedaluwarsa (paling sering tiap check_interval), mengembalikan jumlah yang terbuka
+        now = time.time()
+        sweep = now - self._checked >= self.check_interval
+        if sweep:
+            self._checked = now
+        count = 0
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            if sweep and self._expire(entry.path, now):
+                continue
+            count += 1
+        return count
+
+    def _expire(self, path, now):
+        try:
+            mtime = os.stat(os.path.join(path, 'state.json')).st_mtime
+        except FileNotFoundError:
+            return False
+        if now - mtime < self.ttl:
+            return False
+        try:
+            with open(os.path.join(path, 'lock'), 'rb') as lock:
+                # Deposit yang sedang dipakai request lain tidak dihapus
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                shutil.rmtree(path, ignore_errors=True)
+        except (BlockingIOError, FileNotFoundError):
+            return False
+        self.expired += 1
+        return True
+
+    def open(self, machine_id=None):
+        deposit = Deposit(machine_id, **self.deposit_options)
+        with self._lock:
+            count = self._count()
+            if count >= self.max_open:
+                raise QueueFullError(f"{count} deposits already open")
+            self.opened += 1
+        path = os.path.join(self.directory, deposit.id)
+        os.makedirs(path)
+        open(os.path.join(path, 'lock'), 'wb').close()
+        self._save(path, deposit)
+        return deposit
+
+    def get(self, deposit_id):
+        # Snapshot tanpa lock, untuk status
+        path = self._path(deposit_id)
+        return None if path is None else self._load(path)
+
+    @contextmanager
+    def session(self, deposit_id):
+        # Deposit (atau None) dipegang eksklusif selama blok with. Disimpan di akhir blok,
+        # dihapus kalau sudah closed; kalau blok raise, state di file tidak berubah
+        path = self._path(deposit_id)
+        try:
+            lock = open(os.path.join(path, 'lock'), 'rb') if path is not None else None
+        except FileNotFoundError:
+            lock = None
+        if lock is None:
+            yield None
+            return
+        with lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            deposit = self._load(path)
+            yield deposit
+            if deposit is None:
+                return
+            if deposit.closed:
+                shutil.rmtree(path, ignore_errors=True)
+                with self._lock:
+                    self.closed += 1
+            else:
+                self._save(path, deposit)
+
+    def frame_bytes(self, deposit, slot):
+        # slot 'best' atau 'last_empty'
+        frame_info = deposit.best[0] if slot == 'best' else deposit.last_empty
+        if frame_info[1] is not None:
+            return frame_info[1]
+        with open(os.path.join(self.directory, deposit.id, slot), 'rb') as f:
+            return f.read()
+
+    def stats(self):
+        try:
+            open_deposits = sum(1 for entry in os.scandir(self.directory) if entry.is_dir(follow_symlinks=False))
+        except FileNotFoundError:
+            open_deposits = 0
+        with self._lock:
+            return {
+                "open": open_deposits,
+                "opened": self.opened,
+                "closed": self.closed,
+                "expired": self.expired,
+                "ttl": self.ttl,
+                "directory": self.directory,
+            }
@@ -0,0 +1,333 @@
+import cv2
+import numpy as np
+import logging
+import os
+import time
+
+from model import CLASSES, INPUT_SIZE, MEAN, SCALE_FACTOR
+from backends import backend
+from batching import MicroBatcher, forward_batch
+from cascade import EmptyChuteGate
+from inference_pool import InferencePool
+from metrics import observe, timed
+from roi import crop, roi_pixels
+import tiling
+
+
+def parse_classes(spec):
+    # Dicek saat import: typo seperti 'botle' harus gagal saat start, bukan di tiap request
+    classes = [name.strip() for name in spec.split(',') if name.strip()]
+    unknown = [name for name in classes if name not in CLASSES]
+    if unknown:
+        raise ValueError(f"Unknown detection class(es) {', '.join(unknown)}, expected names from: {', '.join(CLASSES[1:])}")
+    if not classes:
+        raise ValueError("DETECTION_CLASSES is empty, expected at least one class name such as bottle")
+    return classes
+
+
+TARGET_CLASSES = parse_classes(os.environ.get('DETECTION_CLASSES', 'bottle'))
+CONFIDENCE_THRESHOLD = float(os.environ.get('DETECTION_THRESHOLD', 0.1))
+# NMS tambahan lintas kelas; 0 = nonaktif (DetectionOutput SSD sudah melakukan NMS per kelas)
+NMS_THRESHOLD = float(os.environ.get('DETECTION_NMS_THRESHOLD', 0))
+
+# Dipakai untuk menggabungkan hasil tile/level piramida yang saling overlap
+TILE_NMS_THRESHOLD = float(os.environ.get('DETECTION_TILE_NMS', 0.45))
+
+# Tahap pertama cascade: frame chute kosong ditolak sebelum masuk SSD (0 = nonaktif)
+gate = None
+if float(os.environ.get('CASCADE_THRESHOLD', 0)) > 0:
+    gate = EmptyChuteGate(
+        threshold=float(os.environ.get('CASCADE_THRESHOLD')),
+        block=int(os.environ.get('CASCADE_BLOCK', 6)),
+        learn_rate=float(os.environ.get('CASCADE_LEARN_RATE', 0.2)),
+        min_samples=int(os.environ.get('CASCADE_MIN_SAMPLES', 3)),
+    )
+
+# Inferensi di proses terpisah (0 = di proses web itu sendiri)
+inference_pool = None
+if int(os.environ.get('INFERENCE_PROCESSES', 0)) > 0:
+    inference_pool = InferencePool(
+        backend.name,
+        workers=int(os.environ.get('INFERENCE_PROCESSES')),
+        slots=int(os.environ.get('INFERENCE_SLOTS', 32)),
+        threads=int(os.environ.get('INFERENCE_THREADS', 0)) or None,
+        pin_cpus=os.environ.get('INFERENCE_PIN_CPUS', '1') == '1',
+        max_batch_size=int(os.environ.get('BATCH_MAX_SIZE', 8)),
+        slot_timeout=float(os.environ.get('INFERENCE_SLOT_TIMEOUT', 1.0)),
+    )
+
+# Gabungkan request yang datang bersamaan menjadi satu batch inferensi
+batcher = None
+if os.environ.get('INFERENCE_BATCHING', '0') == '1':
+    batcher = MicroBatcher(
+        backend,
+        max_batch_size=int(os.environ.get('BATCH_MAX_SIZE', 8)),
+        max_wait_ms=float(os.environ.get('BATCH_MAX_WAIT_MS', 10)),
+        workers=int(os.environ.get('BATCH_WORKERS', 1)),
+    )
+
+
+def filter_detections(detections, width, height, classes=None, threshold=None, nms_threshold=None, offset=(0, 0)):
+    # Filter output SSD 1x1xNx7 dengan mask NumPy (tanpa loop Python); semua yang lolos, paling
+    # yakin duluan, box dalam piksel frame width x height, digeser offset kalau frame-nya crop
+    classes = TARGET_CLASSES if classes is None else classes
+    threshold = CONFIDENCE_THRESHOLD if threshold is None else threshold
+    nms_threshold = NMS_THRESHOLD if nms_threshold is None else nms_threshold
+
+    rows = detections.reshape(-1, 7)
+    class_ids = rows[:, 1].astype(int)
+    class_mask = np.isin(class_ids, [CLASSES.index(name) for name in classes])
+    rows = rows[class_mask & (rows[:, 2] > threshold)]
+    rows = rows[np.argsort(-rows[:, 2], kind='stable')]
+
+    boxes = np.clip(rows[:, 3:7], 0.0, 1.0) * np.array([width, height, width, height])
+    boxes = boxes.astype(int)
+
+    if nms_threshold > 0 and len(rows) > 1:
+        xywh = [[int(x1), int(y1), int(x2 - x1), int(y2 - y1)] for x1, y1, x2, y2 in boxes]
+        keep = np.array(cv2.dnn.NMSBoxes(xywh, rows[:, 2].tolist(), threshold, nms_threshold)).flatten()
+        rows, boxes = rows[keep], boxes[keep]
+
+    boxes = boxes + np.array([offset[0], offset[1], offset[0], offset[1]])
+    return [
+        {"class": CLASSES[int(row[1])], "confidence": float(row[2]), "box": box.tolist()}
+        for row, box in zip(rows, boxes)
+    ]
+
+
+def draw_detections(frame, objects):
+    for obj in objects:
+        (startX, startY, endX, endY) = obj["box"]
+        percentage = int(obj["confidence"] * 100)
+        cv2.rectangle(frame, (startX, startY), (endX, endY), (0, 255, 0), 2)
+        label = f"{obj['class']}: {percentage}%"
+        y = startY - 8 if startY - 10 > 10 else startY + 10
+        cv2.putText(frame, label, (startX, y), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 0), 2)
+
+
+def merge_detections(objects, nms_threshold=None):
+    # Box yang sama bisa muncul di beberapa tile/level; NMS per kelas atas semuanya
+    nms_threshold = TILE_NMS_THRESHOLD if nms_threshold is None else nms_threshold
+    objects = sorted(objects, key=lambda obj: -obj["confidence"])
+    if len(objects) < 2 or nms_threshold <= 0:
+        return objects
+    xywh = [[x1, y1, x2 - x1, y2 - y1] for x1, y1, x2, y2 in (obj["box"] for obj in objects)]
+    keep = cv2.dnn.NMSBoxesBatched(
+        xywh, [obj["confidence"] for obj in objects], [CLASSES.index(obj["class"]) for obj in objects],
+        0.0, nms_threshold,
+    )
+    return [objects[i] for i in sorted(np.array(keep, dtype=int).flatten())]
+
+
+def _forward_many(images):
+    if inference_pool is not None:
+        # Frame dibagi ke semua worker proses, bukan satu batch di satu proses
+        futures = [inference_pool.submit(image) for image in images]
+        outputs = [future.result() for future in futures]
+        return [output[0] for output in outputs], max(output[1] for output in outputs)
+    return forward_batch(backend, images)
+
+
+def _summarize(detections, output_size, roi=None):
+    with timed('postprocess'):
+        if roi is None:
+            objects = filter_detections(detections, output_size[0], output_size[1])
+        else:
+            # Box dari crop dipetakan kembali ke koordinat frame penuh
+            x, y, width, height = roi_pixels(roi, output_size)
+            objects = filter_detections(detections, width, height, offset=(x, y))
+    return _result(objects)
+
+
+def _result(objects):
+    bottle_found = len(objects) > 0
+    percentage = int(objects[0]["confidence"] * 100) if bottle_found else 0
+    if bottle_found:
+        logging.info(f"{len(objects)} bottle(s) detected!")
+    return bottle_found, percentage, objects
+
+
+def inference_region(roi=None):
+    # Pecahan frame yang menjadi satu input SSD, untuk decode_for_inference: ROI lalu tile
+    # terkecil di dalamnya. Frame di-decode cukup besar supaya bagian itu tetap >= DECODE_MIN_SIDE
+    tile_width, tile_height = tiling.tile_fraction(tiling.grids)
+    if roi is None:
+        return tile_width, tile_height
+    return roi["width"] * tile_width, roi["height"] * tile_height
+
+
+def _tile_inputs(frame, output_size, roi):
+    # Input network untuk tiap tile frame, plus area tiap tile dalam koordinat output_size
+    base_x, base_y, base_width, base_height = roi_pixels(roi, output_size) if roi is not None else (0, 0, *output_size)
+    if roi is not None:
+        frame = crop(frame, roi)
+    height, width = frame.shape[:2]
+    scale_x, scale_y = base_width / width, base_height / height
+
+    inputs, regions = [], []
+    for x, y, tile_width, tile_height in tiling.tile_regions(width, height, tiling.grids):
+        inputs.append(cv2.resize(frame[y:y + tile_height, x:x + tile_width], INPUT_SIZE))
+        regions.append((
+            base_x + int(round(x * scale_x)), base_y + int(round(y * scale_y)),
+            max(1, int(round(tile_width * scale_x))), max(1, int(round(tile_height * scale_y))),
+        ))
+    return inputs, regions
+
+
+def detect_tiled(frames, output_sizes, rois):
+    # Semua tile dari semua frame masuk ke satu forward pass, lalu hasil per
+    # tile dipetakan ke koordinat frame penuh dan digabung dengan NMS
+    total_start_time = time.perf_counter()
+
+    with timed('preprocess'):
+        tiles = [_tile_inputs(frame, size, roi) for frame, size, roi in zip(frames, output_sizes, rois)]
+    detections, inference_time = _forward_many([image for inputs, _ in tiles for image in inputs])
+    observe('forward', inference_time)
+
+    results = []
+    start = 0
+    for inputs, regions in tiles:
+        frame_detections = detections[start:start + len(inputs)]
+        start += len(inputs)
+        with timed('postprocess'):
+            objects = merge_detections([
+                obj
+                for tile_detections, (x, y, width, height) in zip(frame_detections, regions)
+                for obj in filter_detections(tile_detections, width, height, nms_threshold=0, offset=(x, y))
+            ])
+        results.append(_result(objects))
+
+    total_time = time.perf_counter() - total_start_time
+    logging.info(f"{len(frames)} frame(s) as {start} tiles, inference time: {inference_time:.4f} seconds")
+    logging.info(f"Tiled total time (preprocessing + inference + postprocessing): {total_time:.4f} seconds")
+
+    return [
+        (bottle_found, percentage, inference_time, total_time, objects)
+        for bottle_found, percentage, objects in results
+    ]
+
+
+def detect_bottle(frame, output_size=None, roi=None):
+    # output_size = (width, height) tempat koordinat box dikembalikan, misalnya
+    # ukuran asli gambar saat frame di-decode dengan resolusi lebih kecil.
+    # roi = area chute mesin (lihat roi.py); hanya area itu yang masuk ke model
+    output_size = output_size or (frame.shape[1], frame.shape[0])
+    if tiling.grids:
+        return detect_tiled([frame], [output_size], [roi])[0]
+    if roi is not None:
+        frame = crop(frame, roi)
+
+    # Mulai mencatat waktu total
+    total_start_time = time.perf_counter()
+
+    if inference_pool is not None:
+        with timed('preprocess'):
+            resized = cv2.resize(frame, INPUT_SIZE)
+        detections, inference_time = inference_pool.infer(resized)
+    elif batcher is not None:
+        with timed('preprocess'):
+            resized = cv2.resize(frame, INPUT_SIZE)
+        detections, inference_time = batcher.infer(resized)
+    else:
+        with timed('preprocess'):
+            blob = cv2.dnn.blobFromImage(cv2.resize(frame, INPUT_SIZE), SCALE_FACTOR, INPUT_SIZE, MEAN)
+
+        # Mulai mencatat waktu inferensi
+        start_time = time.perf_counter()
+        detections = backend.forward(blob)
+        end_time = time.perf_counter()
+
+        inference_time = end_time - start_time
+    observe('forward', inference_time)
+
+    bottle_found, percentage, objects = _summarize(detections, output_size, roi)
+
+    total_end_time = time.perf_counter()
+    total_time = total_end_time - total_start_time
+    logging.info(f"Inference time: {inference_time:.4f} seconds")
+    logging.info(f"Percentage: {percentage}% confidence")
+    logging.info(f"Total time (preprocessing + inference + postprocessing): {total_time:.4f} seconds")
+
+    return bottle_found, percentage, inference_time, total_time, objects
+
+
+def detect_bottle_and_draw(frame):
+    bottle_found, percentage, inference_time, total_time, objects = detect_bottle(frame)
+    with timed('annotate'):
+        draw_detections(frame, objects)
+    return bottle_found, frame, percentage, inference_time, total_time, objects
+
+
+def detect_bottles(frames, output_sizes=None, rois=None):
+    # Versi batch dari detect_bottle: satu forward pass untuk semua frame
+    output_sizes = output_sizes or [(frame.shape[1], frame.shape[0]) for frame in frames]
+    rois = rois or [None] * len(frames)
+    if tiling.grids:
+        return detect_tiled(frames, output_sizes, rois)
+    frames = [frame if roi is None else crop(frame, roi) for frame, roi in zip(frames, rois)]
+    total_start_time = time.perf_counter()
+
+    with timed('preprocess'):
+        resized = [cv2.resize(frame, INPUT_SIZE) for frame in frames]
+    detections, inference_time = _forward_many(resized)
+    observe('forward', inference_time)
+
+    results = [_summarize(frame_detections, size, roi) for frame_detections, size, roi in zip(detections, output_sizes, rois)]
+
+    total_time = time.perf_counter() - total_start_time
+    logging.info(f"Batch of {len(frames)} images, inference time: {inference_time:.4f} seconds")
+    logging.info(f"Batch total time (preprocessing + inference + postprocessing): {total_time:.4f} seconds")
+
+    return [
+        (bottle_found, percentage, inference_time, total_time, objects)
+        for bottle_found, percentage, objects in results
+    ]
+
+
+def _gate(frame, roi, machine_id):
+    with timed('cascade'):
+        return gate.check(machine_id, frame if roi is None else crop(frame, roi))
+
+
+def detect_bottle_gated(frame, output_size=None, roi=None, machine_id=None):
+    # detect_bottle dengan cascade: frame yang mirip referensi chute kosong
+    # mesin ini langsung dianggap kosong tanpa forward pass
+    if gate is None or machine_id is None:
+        return detect_bottle(frame, output_size, roi)
+
+    start_time = time.perf_counter()
+    empty, thumb = _gate(frame, roi, machine_id)
+    if empty:
+        return False, 0, 0.0, time.perf_counter() - start_time, []
+
+    result = detect_bottle(frame, output_size, roi)
+    if not result[0]:
+        gate.learn(machine_id, thumb)
+    return result
+
+
+def detect_bottles_gated(frames, output_sizes=None, rois=None, machine_id=None):
+    if gate is None or machine_id is None:
+        return detect_bottles(frames, output_sizes, rois)
+
+    output_sizes = output_sizes or [(frame.shape[1], frame.shape[0]) for frame in frames]
+    rois = rois or [None] * len(frames)
+    results = [None] * len(frames)
+    pending = []
+    for i, (frame, roi) in enumerate(zip(frames, rois)):
+        start_time = time.perf_counter()
+        empty, thumb = _gate(frame, roi, machine_id)
+        if empty:
+            results[i] = (False, 0, 0.0, time.perf_counter() - start_time, [])
+        else:
+            pending.append((i, thumb))
+
+    if pending:
+        detected = detect_bottles(
+            [frames[i] for i, _ in pending], [output_sizes[i] for i, _ in pending], [rois[i] for i, _ in pending],
+        )
+        for (i, thumb), result in zip(pending, detected):
+            results[i] = result
+            if not result[0]:
+                gate.learn(machine_id, thumb)
+    return results
@@ -0,0 +1,348 @@
+import atexit
+import cv2
+import itertools
+import logging
+import multiprocessing
+import multiprocessing.connection
+import numpy as np
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+from model import INPUT_SIZE
+from workers import QueueFullError
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+FRAME_SHAPE = (INPUT_SIZE[1], INPUT_SIZE[0], 3)
+FRAME_BYTES = int(np.prod(FRAME_SHAPE))
+
+
+INFERENCE_LOCK_DIR = os.environ.get('INFERENCE_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'sampahmas-inference-cpus'))
+
+
+def cpu_lanes(workers, threads=None, pin=True):
+    # Bagi CPU proses ini menjadi lane berisi `threads` core berurutan (default: bagi rata per
+    # worker); None kalau pinning nonaktif atau affinity tidak didukung
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+    size = min(len(cpus), threads or max(1, len(cpus) // workers))
+    if not pin or not hasattr(os, 'sched_setaffinity') or fcntl is None:
+        return None, size
+    return [cpus[start:start + size] for start in range(0, len(cpus) - size + 1, size)], size
+
+
+def claim_lane(lanes, first=0, lock_dir=INFERENCE_LOCK_DIR):
+    # Semua pool (satu per worker gunicorn) melihat lane yang sama, jadi lane diklaim dengan flock
+    # pada file bernama sesuai core-nya, dilepas kernel saat proses inferensi keluar.
+    # (lane, lock_file), atau (None, None) kalau semua sudah terpakai
+    os.makedirs(lock_dir, exist_ok=True)
+    for i in range(len(lanes)):
+        lane = lanes[(first + i) % len(lanes)]
+        lock_file = open(os.path.join(lock_dir, "cpus-" + "-".join(str(cpu) for cpu in lane) + ".lock"), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            continue
+        return lane, lock_file
+    return None, None
+
+
+def _worker_main(index, backend_name, shm_name, slots, conn, lanes, threads, max_batch_size):
+    cpus = lock_file = None
+    if lanes is not None:
+        cpus, lock_file = claim_lane(lanes, first=index)
+        if cpus is None:
+            logging.warning(f"Inference worker {index}: all {len(lanes)} CPU lanes are taken by other pools, running unpinned")
+        else:
+            os.sched_setaffinity(0, cpus)
+    # Satu worker = satu set core; thread OpenCV/onnxruntime tidak boleh melebihi itu
+    cv2.setNumThreads(threads)
+    os.environ.setdefault('ONNX_THREADS', str(threads))
+
+    from backends import create_backend
+    from batching import forward_batch
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    ring = np.ndarray((slots,) + FRAME_SHAPE, np.uint8, buffer=shm.buf)
+    try:
+        backend = create_backend(backend_name)
+        backend.load()
+    except Exception as e:
+        conn.send((None, None, 0.0, f"{type(e).__name__}: {e}"))
+        return
+    # Pesan siap membawa lane CPU yang didapat worker ini
+    conn.send((None, cpus, 0.0, None))
+
+    while True:
+        try:
+            item = conn.recv()
+        except EOFError:
+            break
+        if item is None:
+            break
+        # Frame lain yang sudah menunggu ikut di forward pass yang sama
+        batch = [item]
+        while len(batch) < max_batch_size and conn.poll():
+            item = conn.recv()
+            if item is None:
+                break
+            batch.append(item)
+
+        try:
+            detections, inference_time = forward_batch(backend, [ring[slot] for _, slot in batch])
+            for (request_id, _), image_detections in zip(batch, detections):
+                conn.send((request_id, image_detections, inference_time, None))
+        except Exception as e:
+            for request_id, _ in batch:
+                conn.send((request_id, None, 0.0, f"{type(e).__name__}: {e}"))
+        if item is None:
+            break
+
+    del ring
+    shm.close()
+
+
+class _Worker:
+    __slots__ = ('index', 'process', 'conn', 'send_lock', 'in_flight', 'cpus', 'restarting')
+
+    def __init__(self, index, process, conn, cpus=None):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.in_flight = set()
+        self.cpus = cpus
+        self.restarting = False
+
+
+class InferencePool:
+    # Model dijalankan di proses terpisah supaya inferensi tidak terikat GIL worker web. Frame
+    # ditulis ke ring slot di shared memory; yang menyeberang proses hanya indeks slot dan array
+    # deteksi kecil. Tiap worker punya pipe sendiri: worker crash hanya menggagalkan request yang
+    # dipegangnya lalu di-restart. Frame menunggu slot paling lama slot_timeout, lalu QueueFullError.
+    # Dengan pinning, tiap proses mengklaim lane core sendiri lewat claim_lane().
+    # Worker di-start dengan 'spawn', jadi __main__ induk harus aman di-import (benar di gunicorn)
+
+    def __init__(self, backend_name, workers=2, slots=32, threads=None, pin_cpus=True,
+                 max_batch_size=8, slot_timeout=1.0, start_method='spawn'):
+        self.backend_name = backend_name
+        self.workers = workers
+        self.slots = slots
+        self.pin_cpus = pin_cpus
+        self.threads = threads
+        self.max_batch_size = max_batch_size
+        self.slot_timeout = slot_timeout
+        self._context = multiprocessing.get_context(start_method)
+        self._lock = threading.Lock()
+        self._started = False
+        self._workers = []
+        self._pending = {}
+        self._ids = itertools.count()
+        self._free = queue.Queue()
+        self.shm = None
+        self.requests = 0
+        self.failed = 0
+        self.restarts = 0
+        self.startup_time = None
+
+    def start(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            start_time = time.perf_counter()
+            self.shm = shared_memory.SharedMemory(create=True, size=self.slots * FRAME_BYTES)
+            self._ring = np.ndarray((self.slots,) + FRAME_SHAPE, np.uint8, buffer=self.shm.buf)
+            for slot in range(self.slots):
+                self._free.put(slot)
+
+            self._lanes, self._threads_per_worker = cpu_lanes(self.workers, self.threads, self.pin_cpus)
+            try:
+                self._workers = [self._spawn(i) for i in range(self.workers)]
+            except Exception:
+                self._terminate()
+                self._ring = None
+                self.shm.close()
+                self.shm.unlink()
+                raise
+            self.startup_time = time.perf_counter() - start_time
+
+            self._started = True
+            threading.Thread(target=self._collect, name="InferencePool-results", daemon=True).start()
+            atexit.register(self.stop)
+        logging.info(
+            f"Inference pool started: {self.workers} '{self.backend_name}' workers, "
+            f"{self._threads_per_worker} threads each, {self.slots} slots, in {self.startup_time:.4f} seconds"
+        )
+
+    def _spawn(self, index):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            name=f"InferenceWorker-{index}",
+            args=(index, self.backend_name, self.shm.name, self.slots, child_conn,
+                  self._lanes, self._threads_per_worker, self.max_batch_size),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        # Tunggu model selesai dimuat dan di-warm-up
+        if not parent_conn.poll(120):
+            process.terminate()
+            raise RuntimeError(f"Inference worker {index} did not start within 120 seconds")
+        try:
+            _, cpus, _, error = parent_conn.recv()
+        except EOFError:
+            cpus, error = None, f"exited with code {process.join(5) or process.exitcode}"
+        if error is not None:
+            process.terminate()
+            raise RuntimeError(f"Inference worker {index} failed to start: {error}")
+        return _Worker(index, process, parent_conn, cpus)
+
+    def _collect(self):
+        while self._started:
+            with self._lock:
+                live = [worker for worker in self._workers if not worker.restarting]
+            workers = {worker.conn: worker for worker in live}
+            sentinels = {worker.process.sentinel: worker for worker in live}
+            ready = multiprocessing.connection.wait(list(workers) + list(sentinels), timeout=1.0)
+            for item in ready:
+                if item in workers:
+                    try:
+                        message = item.recv()
+                    except (EOFError, OSError):
+                        continue
+                    self._complete(workers[item], *message)
+            for item in ready:
+                if item in sentinels and self._started:
+                    self._restart(sentinels[item])
+
+    def _complete(self, worker, request_id, detections, inference_time, error):
+        with self._lock:
+            future, slot = self._pending.pop(request_id, (None, None))
+            worker.in_flight.discard(request_id)
+            if error is not None:
+                self.failed += 1
+        if future is None:
+            return
+        self._free.put(slot)
+        if error is not None:
+            future.set_exception(RuntimeError(f"Inference failed: {error}"))
+        else:
+            future.set_result((detections, inference_time))
+
+    def _restart(self, worker):
+        # Request yang dipegang worker ini langsung digagalkan; proses penggantinya
+        # dimuat di thread terpisah, karena _spawn() bisa sampai 120 detik dan
+        # selama itu hasil dari worker lain harus tetap dikumpulkan
+        worker.process.join(1.0)
+        logging.error(f"Inference worker {worker.index} (pid {worker.process.pid}) exited with code {worker.process.exitcode}, restarting")
+        with self._lock:
+            worker.restarting = True
+            self.restarts += 1
+        worker.conn.close()
+        for request_id in list(worker.in_flight):
+            self._complete(worker, request_id, None, 0.0, f"worker {worker.index} exited")
+        threading.Thread(target=self._respawn, args=(worker.index,), name=f"InferencePool-restart-{worker.index}", daemon=True).start()
+
+    def _respawn(self, index):
+        try:
+            replacement = self._spawn(index)
+        except Exception as e:
+            logging.error(f"Failed to restart inference worker {index}: {e}")
+            return
+        with self._lock:
+            if self._started:
+                self._workers[index] = replacement
+                return
+        # Pool dihentikan selagi worker pengganti dimuat
+        replacement.process.terminate()
+
+    def submit(self, image):
+        # image harus sudah di-resize ke ukuran input network
+        self.start()
+        try:
+            slot = self._free.get(timeout=self.slot_timeout)
+        except queue.Empty:
+            with self._lock:
+                self.failed += 1
+            raise QueueFullError(f"No free inference slot within {self.slot_timeout} seconds")
+        self._ring[slot] = image
+
+        future = Future()
+        with self._lock:
+            request_id = next(self._ids)
+            worker = min(
+                (worker for worker in self._workers if not worker.restarting and worker.process.is_alive()),
+                key=lambda worker: len(worker.in_flight),
+                default=None,
+            )
+            if worker is not None:
+                self._pending[request_id] = (future, slot)
+                worker.in_flight.add(request_id)
+                self.requests += 1
+        if worker is None:
+            self._free.put(slot)
+            raise QueueFullError("No inference worker is running")
+        try:
+            with worker.send_lock:
+                worker.conn.send((request_id, slot))
+        except (OSError, ValueError):
+            # Worker mati di tengah jalan; _restart() akan menggagalkan request ini
+            pass
+        return future
+
+    def infer(self, image, timeout=None):
+        return self.submit(image).result(timeout)
+
+    def _terminate(self):
+        for worker in self._workers:
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+    def stop(self, timeout=5.0):
+        if not self._started:
+            return
+        self._started = False
+        for worker in self._workers:
+            try:
+                with worker.send_lock:
+                    worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+        self._terminate()
+        self._ring = None
+        self.shm.close()
+        self.shm.unlink()
+        logging.info("Inference pool stopped")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "alive": sum(1 for worker in self._workers if worker.process.is_alive()),
+                "threads_per_worker": getattr(self, '_threads_per_worker', None),
+                "cpu_sets": [worker.cpus for worker in self._workers],
+                "slots": self.slots,
+                "free_slots": self._free.qsize(),
+                "in_flight": len(self._pending),
+                "requests": self.requests,
+                "failed": self.failed,
+                "restarts": self.restarts,
+                "startup_time": self.startup_time,
+            }
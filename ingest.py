@@ -0,0 +1,183 @@
+import threading
+
+from decode import sniff_image_type
+from workers import QueueFullError
+
+# Cukup untuk membedakan header PNG dan JPEG
+SNIFF_BYTES = 8
+
+
+class IngestError(Exception):
+    # Bukan ValueError: parser form Werkzeug menelannya diam-diam
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class BufferPool:
+    # Buffer upload yang dipakai ulang, total byte dibatasi max_bytes. Ukuran pangkat dua (minimal
+    # min_buffer) supaya buffer bekas cocok untuk upload berikutnya; buffer idle dibuang kalau perlu
+    # tempat. Kalau upload yang berjalan sudah memakai max_bytes, acquire() raise QueueFullError
+
+    def __init__(self, max_bytes, min_buffer=1024 * 1024):
+        self.max_bytes = max_bytes
+        self.min_buffer = min_buffer
+        self._idle = []
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.allocated = 0
+        self.reused = 0
+        self.rejected = 0
+
+    def _capacity(self, size):
+        capacity = self.min_buffer
+        while capacity < size:
+            capacity *= 2
+        return capacity
+
+    def acquire(self, size):
+        with self._lock:
+            fits = [buffer for buffer in self._idle if len(buffer) >= size]
+            if fits:
+                buffer = min(fits, key=len)
+                self._idle.remove(buffer)
+                self.in_use += len(buffer)
+                self.reused += 1
+                return buffer
+
+            capacity = self._capacity(size)
+            self._idle.sort(key=len)
+            while self._idle and self.in_use + self._idle_bytes() + capacity > self.max_bytes:
+                self._idle.pop()
+            if self.in_use + capacity > self.max_bytes:
+                self.rejected += 1
+                raise QueueFullError(f"Upload buffers exhausted ({self.in_use} of {self.max_bytes} bytes in use)")
+            self.in_use += capacity
+            self.allocated += 1
+        return bytearray(capacity)
+
+    def release(self, buffer):
+        with self._lock:
+            self.in_use -= len(buffer)
+            self._idle.append(buffer)
+
+    def _idle_bytes(self):
+        return sum(len(buffer) for buffer in self._idle)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_use": self.in_use,
+                "idle": self._idle_bytes(),
+                "max_bytes": self.max_bytes,
+                "allocated": self.allocated,
+                "reused": self.reused,
+                "rejected": self.rejected,
+            }
+
+
+class PooledUpload:
+    # File object di atas buffer dari pool. Parser multipart Werkzeug menulis langsung ke sini, body
+    # mentah dibaca dengan readinto(); upload hanya ada sekali di memori dan view() tanpa salinan.
+    # Signature PNG/JPEG dan limit dicek saat data masuk, jadi upload buruk ditolak lebih awal
+
+    def __init__(self, pool, limit, expected_size=None):
+        self.pool = pool
+        self.limit = limit
+        self.buffer = pool.acquire(min(expected_size, limit) if expected_size else pool.min_buffer)
+        self.length = 0
+        self.position = 0
+        self.image_type = None
+        self.closed = False
+
+    def _check(self):
+        if self.length > self.limit:
+            raise IngestError(f"File too large, the limit is {self.limit} bytes", 413)
+        if self.image_type is None and self.length >= SNIFF_BYTES:
+            self.image_type = sniff_image_type(self.buffer[:SNIFF_BYTES])
+            if self.image_type is None:
+                raise IngestError("Invalid file format. Only PNG and JPEG are accepted.", 415)
+
+    def _grow(self, size):
+        # Hanya terjadi kalau client mengirim lebih dari yang diumumkan
+        buffer = self.pool.acquire(size)
+        buffer[:self.length] = self.buffer[:self.length]
+        self.pool.release(self.buffer)
+        self.buffer = buffer
+
+    def write(self, data):
+        end = self.position + len(data)
+        if end > self.limit:
+            self.length = end
+            self._check()
+        if end > len(self.buffer):
+            self._grow(end)
+        self.buffer[self.position:end] = data
+        self.position = end
+        self.length = max(self.length, end)
+        self._check()
+        return len(data)
+
+    def read_from(self, stream, chunk_size=64 * 1024):
+        while True:
+            if self.length == len(self.buffer):
+                if self.length >= self.limit + 1:
+                    break
+                self._grow(min(len(self.buffer) * 2, self.limit + 1))
+            with memoryview(self.buffer) as target:
+                read = stream.readinto(target[self.length:self.length + chunk_size])
+            if not read:
+                break
+            self.length += read
+            self._check()
+        self.position = self.length
+        return self.finish()
+
+    def finish(self):
+        # Cek akhir body untuk upload yang terlalu pendek untuk dicek saat masuk
+        if self.length == 0:
+            raise IngestError("No image data provided", 400)
+        if self.length < SNIFF_BYTES:
+            self.image_type = sniff_image_type(self.buffer[:self.length])
+            if self.image_type is None:
+                raise IngestError("Invalid file format. Only PNG and JPEG are accepted.", 415)
+        return self
+
+    def view(self):
+        return memoryview(self.buffer)[:self.length]
+
+    def seek(self, position, whence=0):
+        if whence == 1:
+            position += self.position
+        elif whence == 2:
+            position += self.length
+        self.position = position
+        return position
+
+    def tell(self):
+        return self.position
+
+    def read(self, size=-1):
+        end = self.length if size is None or size < 0 else min(self.length, self.position + size)
+        data = bytes(self.buffer[self.position:end])
+        self.position = end
+        return data
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.pool.release(self.buffer)
+            self.buffer = None
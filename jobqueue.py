@@ -0,0 +1,194 @@
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+
+class JobQueue:
+    # Outbox SQLite untuk kerja setelah deteksi (upload, notifikasi). Job ditulis ke disk
+    # sebelum dijalankan supaya selamat dari gangguan upstream dan restart. Yang gagal diulang
+    # dengan backoff eksponensial sampai max_attempts, lalu disimpan berstatus 'dead'
+
+    def __init__(self, path, max_attempts=8, base_delay=2.0, max_delay=600.0, lease=120.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease = lease
+        self.handlers = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stopping = False
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                leased_until REAL,
+                last_error TEXT,
+                created REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, next_attempt)")
+
+    def register(self, kind, handler):
+        # handler(job_id, payload) harus raise kalau percobaannya gagal
+        self.handlers[kind] = handler
+
+    def enqueue(self, kind, payload, delay=0.0):
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (kind, payload, next_attempt, created) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(payload), now + delay, now),
+            )
+        return cursor.lastrowid
+
+    def update_payload(self, job_id, **changes):
+        # Simpan progres supaya job yang diulang melewati langkah yang sudah berhasil
+        with self._lock:
+            row = self._conn.execute("SELECT payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            payload = json.loads(row[0])
+            payload.update(changes)
+            self._conn.execute("UPDATE jobs SET payload = ? WHERE id = ?", (json.dumps(payload), job_id))
+
+    def _claim(self, job_id=None):
+        # UPDATE bersyarat: klaim tetap atomik walau beberapa proses worker berbagi file database
+        now = time.time()
+        due = "((status = 'pending' AND next_attempt <= ?) OR (status = 'running' AND leased_until <= ?))"
+        with self._lock:
+            if job_id is None:
+                row = self._conn.execute(
+                    f"SELECT id FROM jobs WHERE {due} ORDER BY next_attempt LIMIT 1", (now, now)
+                ).fetchone()
+                if row is None:
+                    return None
+                job_id = row[0]
+                condition, params = due, (now, now)
+            else:
+                condition, params = "status = 'pending'", ()
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET status = 'running', leased_until = ? WHERE id = ? AND {condition}",
+                (now + self.lease, job_id) + params,
+            )
+            if cursor.rowcount != 1:
+                return None
+            row = self._conn.execute("SELECT kind, payload, attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return job_id, row[0], json.loads(row[1]), row[2]
+
+    def _complete(self, job_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def _fail(self, job_id, attempts, error):
+        attempts += 1
+        if attempts >= self.max_attempts:
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'dead', attempts = ?, last_error = ?, leased_until = NULL WHERE id = ?",
+                    (attempts, error, job_id),
+                )
+            logging.error(f"Job {job_id} failed permanently after {attempts} attempts: {error}")
+            return
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        delay *= random.uniform(0.8, 1.2)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'pending', attempts = ?, last_error = ?, next_attempt = ?, leased_until = NULL WHERE id = ?",
+                (attempts, error, time.time() + delay, job_id),
+            )
+        logging.warning(f"Job {job_id} failed (attempt {attempts}), retrying in {delay:.1f} seconds: {error}")
+        self._wakeup.set()
+
+    def run(self, job_id=None):
+        # Jalankan satu job sekarang (job_id, atau yang paling dulu jatuh tempo); False kalau tidak ada
+        claimed = self._claim(job_id)
+        if claimed is None:
+            return False
+        job_id, kind, payload, attempts = claimed
+        handler = self.handlers.get(kind)
+        if handler is None:
+            self._fail(job_id, self.max_attempts - 1, f"No handler registered for job kind '{kind}'")
+            return True
+        try:
+            handler(job_id, payload)
+        except Exception as e:
+            self._fail(job_id, attempts, str(e))
+        else:
+            self._complete(job_id)
+        return True
+
+    def run_later(self, job_id):
+        # Job yang tadinya mau dijalankan inline diserahkan ke thread drainer
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET next_attempt = ? WHERE id = ? AND status = 'pending'",
+                (time.time(), job_id),
+            )
+        self._wakeup.set()
+
+    def _seconds_until_next(self):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(next_attempt) FROM jobs WHERE status = 'pending'"
+            ).fetchone()
+        if row[0] is None:
+            return self.lease
+        return max(0.0, row[0] - time.time())
+
+    def _drain_loop(self, poll_interval):
+        while not self._stopping:
+            try:
+                while not self._stopping and self.run():
+                    pass
+            except Exception as e:
+                logging.error(f"Error draining job queue: {str(e)}")
+            self._wakeup.wait(min(poll_interval, self._seconds_until_next()))
+            self._wakeup.clear()
+
+    def start(self, poll_interval=5.0):
+        # Job pending dari run sebelumnya langsung diambil; yang tertinggal 'running' setelah lease habis
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._drain_loop, args=(poll_interval,), name="JobQueue", daemon=True)
+            self._thread.start()
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+
+    def payloads(self, kind=None, status=None):
+        # Payload semua job yang masih ada (pending, running atau dead), bisa difilter
+        conditions, params = [], []
+        if kind is not None:
+            conditions.append("kind = ?")
+            params.append(kind)
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT payload FROM jobs{where}", params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {"pending": 0, "running": 0, "dead": 0}
+        counts.update(dict(rows))
+        return counts
@@ -1,21 +1,67 @@
-from flask import Flask, request, jsonify
-import cv2
-import cvlib as cv
-import numpy as np
-import requests
+import time
+_import_start = time.perf_counter()
+
+from flask import Flask, Request, Response, current_app, request, jsonify, stream_with_context, url_for
 import logging
-import firebase_admin
-from firebase_admin import credentials, storage
 import uuid
 import os
+import json
+import shutil
+import tarfile
+import tempfile
+import zipfile
+import zlib
+import threading
 from werkzeug.utils import secure_filename
-from concurrent.futures import ThreadPoolExecutor
-import time
+from backends import backend
+from detector import batcher, detect_bottle_gated, detect_bottles_gated, gate, inference_pool, inference_region
+from decode import decode_for_inference, sniff_image_type
+from annotations import Annotation, AnnotationStore, tmpfs_dir
+from workers import QueueFullError, WorkerPool
+from ingest import BufferPool, IngestError, PooledUpload
+from jobqueue import JobQueue
+from spool import MemoryBudget, SpoolManager
+from notifier import Notifier
+from metrics import metrics, timed
+from cache import ResultCache, content_hash, perceptual_hash
+from deposits import DepositStore
+from roi import RoiStore, crop
+from startup import LazyResource, StartupReport
+from storage import LocalBucket, Uploader
 
 logging.basicConfig(level=logging.INFO)
 
+class UploadRequest(Request):
+    # MAX_CONTENT_LENGTH berlaku per gambar; endpoint batch punya batas sendiri untuk seluruh request
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'upload_batch':
+            return current_app.config['BATCH_MAX_CONTENT_LENGTH']
+        return current_app.config['MAX_CONTENT_LENGTH']
+
+    @property
+    def pooled_uploads(self):
+        return self.__dict__.setdefault('_pooled_uploads', [])
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # File dari /upload langsung ditulis parser multipart ke buffer pool, bukan ke SpooledTemporaryFile
+        if self.endpoint not in ('upload_file', 'deposit_frame'):
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        upload = PooledUpload(upload_buffers, current_app.config['MAX_CONTENT_LENGTH'], total_content_length)
+        self.pooled_uploads.append(upload)
+        return upload
+
+    def close(self):
+        super().close()
+        for upload in self.pooled_uploads:
+            upload.close()
+
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.config['MAX_CONTENT_LENGTH'] = 40 * 1024 * 1024
+app.config['BATCH_MAX_CONTENT_LENGTH'] = int(os.environ.get('BATCH_MAX_CONTENT_LENGTH', 1024 * 1024 * 1024))
+app.config['UPLOAD_BATCH_SIZE'] = int(os.environ.get('UPLOAD_BATCH_SIZE', 8))
+app.config['RETRY_AFTER'] = int(os.environ.get('RETRY_AFTER', 5))
 
 # DEVELOPMENT
 # if not os.environ.get('GOOGLE_APPLICATION_CREDENTIALS'):
@@ -31,117 +77,213 @@ app.config['MAX_CONTENT_LENGTH'] = 40 * 1024 * 1024
 # })
 
 # PRODUCTION
-service_account_path = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS').strip()
-
-if service_account_path is None:
-    raise ValueError("Environment variable GOOGLE_APPLICATION_CREDENTIALS not set")
-
-cred = credentials.Certificate(service_account_path)
-firebase_admin.initialize_app(cred, {
-    'storageBucket': 'sampahmas-3a4f0.appspot.com'
-})
-
-bucket = storage.bucket()
-
-def detect_bottle_and_draw(frame):
-    import time
-
-    net = cv2.dnn.readNetFromCaffe('MobileNetSSD_deploy.prototxt', 'MobileNetSSD_deploy.caffemodel')
-    CLASSES = ["background", "aeroplane", "bicycle", "bird", "boat",
-               "bottle", "bus", "car", "cat", "chair", "cow", "diningtable",
-               "dog", "horse", "motorbike", "person", "pottedplant", "sheep",
-               "sofa", "train", "tvmonitor"]
-
-    # Mulai mencatat waktu total
-    total_start_time = time.time()
-
-    blob = cv2.dnn.blobFromImage(cv2.resize(frame, (300, 300)), 0.007843, (300, 300), 127.5)
-    net.setInput(blob)
-
-    # Mulai mencatat waktu inferensi
-    start_time = time.time()
-    detections = net.forward()
-    end_time = time.time()
-
-    inference_time = end_time - start_time
-
-    bottle_found = False
-    percentage = 0
-
-    for i in range(detections.shape[2]):
-        confidence = detections[0, 0, i, 2]
-        if confidence > 0.1:
-            idx = int(detections[0, 0, i, 1])
-            if CLASSES[idx] == "bottle":
-                logging.info("Bottle detected!")
-                bottle_found = True
-                percentage = int(confidence * 100)
-                box = detections[0, 0, i, 3:7] * np.array([frame.shape[1], frame.shape[0], frame.shape[1], frame.shape[0]])
-                (startX, startY, endX, endY) = box.astype("int")
-
-                cv2.rectangle(frame, (startX, startY), (endX, endY), (0, 255, 0), 2)
-                label = f"{CLASSES[idx]}: {percentage}%"
-                y = startY - 8 if startY - 10 > 10 else startY + 10
-                cv2.putText(frame, label, (startX, y), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 0), 2)
-                break
-
-    total_end_time = time.time()
-    total_time = total_end_time - total_start_time
-    logging.info(f"Inference time: {inference_time:.4f} seconds")
-    logging.info(f"Percentage: {percentage}% confidence")
-    logging.info(f"Total time (preprocessing + inference + postprocessing): {total_time:.4f} seconds")
-
-    return bottle_found, frame, percentage, inference_time, total_time
-
-
-def upload_to_firebase(file_path, firebase_path):
-    try:
-        logging.info("Starting upload to Firebase Storage")
-        blob = bucket.blob(firebase_path)
-        blob.upload_from_filename(file_path)
-        blob.make_public()
-        logging.info(f"File uploaded to Firebase Storage!")
-        return blob.public_url
-    except Exception as e:
-        logging.error(f"Error uploading to Firebase Storage: {str(e)}")
-        return None
+def init_firebase():
+    # Bucket lokal untuk test/offline: objek ditulis ke direktori ini, bukan ke Firebase
+    local_bucket = os.environ.get('FIREBASE_LOCAL_BUCKET')
+    if local_bucket:
+        return LocalBucket(local_bucket)
+
+    # firebase_admin (dan google-cloud-storage) baru di-import saat pertama kali dibutuhkan
+    import firebase_admin
+    from firebase_admin import credentials, storage
+
+    service_account_path = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS')
+    if service_account_path is None or not service_account_path.strip():
+        raise ValueError("Environment variable GOOGLE_APPLICATION_CREDENTIALS not set")
+
+    cred = credentials.Certificate(service_account_path.strip())
+    firebase_admin.initialize_app(cred, {
+        'storageBucket': os.environ.get('FIREBASE_STORAGE_BUCKET', 'sampahmas-3a4f0.appspot.com')
+    })
+    return storage.bucket()
+
+def load_model():
+    # backend.load() / pool start sudah termasuk satu forward pass dummy (warm-up)
+    if inference_pool is not None:
+        inference_pool.start()
+    else:
+        backend.load()
+    return backend
+
+startup = StartupReport(_import_start)
+firebase = LazyResource('firebase', init_firebase, report=startup)
+model = LazyResource('model', load_model, report=startup)
+
+# Satu pool untuk semua upload Firebase + notifikasi, dengan antrean terbatas
+upload_pool = WorkerPool(
+    max_workers=int(os.environ.get('UPLOAD_WORKERS', 3)),
+    max_queue=int(os.environ.get('UPLOAD_QUEUE_SIZE', 100)),
+    name="Upload",
+)
+upload_pool.install_shutdown_handlers(drain_timeout=float(os.environ.get('UPLOAD_DRAIN_TIMEOUT', 25)))
+
+# Satu client bucket dipakai bersama; original dan gambar anotasi di-upload paralel
+uploader = Uploader(firebase.get, workers=int(os.environ.get('STORAGE_UPLOAD_WORKERS', 4)))
+
+notifier = Notifier(
+    os.environ.get('NODE_API_URL', 'https://m2bvdfxc-3000.asse.devtunnels.ms/api/endpoint'),
+    batch_url=os.environ.get('NODE_API_BATCH_URL'),
+    connect_timeout=float(os.environ.get('NODE_API_CONNECT_TIMEOUT', 3.05)),
+    read_timeout=float(os.environ.get('NODE_API_READ_TIMEOUT', 10)),
+    retries=int(os.environ.get('NODE_API_RETRIES', 2)),
+    pool_size=int(os.environ.get('NODE_API_POOL_SIZE', 10)),
+    batch_window_ms=float(os.environ.get('NODE_API_BATCH_WINDOW_MS', 50)),
+)
 
 def send_data_to_node_api(url):
-    NODE_API_URL = 'https://m2bvdfxc-3000.asse.devtunnels.ms/api/endpoint'
     data = {"message": "Bottle detected", "url": url}
-
-    try:
-        response = requests.post(NODE_API_URL, json=data)
-        if response.status_code == 200:
-            logging.info("Data sent to Node.js API successfully")
+    with timed('node_api'):
+        sent = notifier.send(data)
+    if sent:
+        logging.info("Data sent to Node.js API successfully")
+        return True
+    return False
+
+# Annotation yang masih ada di memori untuk job upload yang sedang dikerjakan proses ini
+memory_uploads = {}
+
+def spooled_annotation(payload):
+    with open(payload['original_path'], 'rb') as f:
+        return Annotation(f.read(), payload['full_size'], payload['bottles'], payload.get('extension', '.jpg'))
+
+def background_task(job_id, payload):
+    # Setiap langkah yang berhasil dicatat di job, jadi retry tidak mengulang upload yang sudah selesai.
+    # Kalau Annotation-nya masih di memori (jalur cepat), file di spool tidak dibaca sama sekali
+    annotation = memory_uploads.get(job_id)
+    original_url, annotated_url = payload.get('original_url'), payload.get('annotated_url')
+    spooled = [path for path in (payload['original_path'], payload.get('annotated_path')) if path]
+
+    if annotation is None and (original_url is None or annotated_url is None):
+        if not all(os.path.exists(path) for path in spooled):
+            # Spool tidak membuang file job yang masih hidup; kalau tetap hilang (mis. tmpfs di-reset), retry tidak akan berhasil
+            logging.error(f"Spooled files {spooled} are gone, dropping upload job {job_id}")
+            for path in spooled:
+                spool.remove(path)
+            return
+
+    content_type = payload.get('content_type')
+    original_upload = None
+    if original_url is None:
+        original = annotation.file_bytes if annotation is not None else payload['original_path']
+        original_upload = uploader.submit(original, f"vending/original/{payload['original_name']}", content_type)
+
+    # Original sudah mulai di-upload selagi gambar anotasi dirender
+    if annotated_url is None:
+        if annotation is not None:
+            annotated = annotation.render()
+        elif payload.get('annotated_path'):
+            annotated = payload['annotated_path']
         else:
-            logging.error(f"Failed to send data to Node.js API: {response.status_code}")
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error sending data to Node.js API: {e}")
-
-def background_task(original_path, annotated_path, original_name, annotated_name, percentage):
+            annotated = spooled_annotation(payload).render()
+        annotated_url = uploader.upload(annotated, f"vending/label/{payload['percentage']}_{payload['annotated_name']}", content_type)
+    if original_upload is not None:
+        original_url = original_upload.result()
+
+    jobs.update_payload(job_id, original_url=original_url, annotated_url=annotated_url)
+    if original_url is None:
+        raise RuntimeError("Failed to upload original image")
+    if annotated_url is None:
+        raise RuntimeError("Failed to upload annotated image")
+
+    logging.info(f"Original and annotated images uploaded. URLs: {original_url}, {annotated_url}")
+
+    if payload.get('notify_job') is None:
+        notify_job = jobs.enqueue('notify', {"url": original_url}, delay=JOB_LEASE)
+        jobs.update_payload(job_id, notify_job=notify_job)
+        submit_job(notify_job)
+
+    for path in spooled:
+        spool.remove(path)
+        logging.info(f"Deleted temporary file: {path}")
+
+def upload_size_estimate(annotation):
+    # Original + gambar anotasi yang ukurannya kira-kira sama
+    return 2 * len(annotation.file_bytes)
+
+def record_upload(annotation, meta):
+    # Original ditulis ke spool dan job dicatat di SQLite sebelum ada panggilan ke cloud,
+    # jadi upload tetap jalan walau proses mati atau drain saat shutdown habis waktunya.
+    # Gambar anotasi tidak ditulis: kalau perlu, dirender ulang dari original + bottles
+    with timed('spill_write'):
+        original_path = spool.write(meta['original_name'], annotation.file_bytes)
+    return jobs.enqueue('upload', {
+        "original_path": original_path,
+        "original_name": meta['original_name'],
+        "annotated_name": meta['annotated_name'],
+        "percentage": meta['percentage'],
+        "content_type": meta['content_type'],
+        "extension": annotation.extension,
+        "full_size": [int(value) for value in annotation.full_size],
+        "bottles": annotation.bottles,
+    }, delay=JOB_LEASE)
+
+def memory_upload_task(job_id, annotation, reserved):
+    # Jalur cepat: job yang sudah tercatat dikerjakan langsung dengan byte yang masih di memori.
+    # Kalau gagal, JobQueue me-retry dari file di spool
+    memory_uploads[job_id] = annotation
     try:
-        original_firebase_path = f'vending/original/{original_name}'
-        annotated_firebase_path = f'vending/label/{percentage}_{annotated_name}'
-
-        original_url = upload_to_firebase(original_path, original_firebase_path)
-        annotated_url = upload_to_firebase(annotated_path, annotated_firebase_path)
-
-        if original_url:
-            send_data_to_node_api(original_url)
-        
-        logging.info(f"Original and annotated images uploaded. URLs: {original_url}, {annotated_url}")
-
-        if original_url and annotated_url:
-            if os.path.exists(original_path):
-                os.remove(original_path)
-                logging.info(f"Deleted temporary file: {original_path}")
-            if os.path.exists(annotated_path):
-                os.remove(annotated_path)
-                logging.info(f"Deleted temporary file: {annotated_path}")
-        
-    except Exception as e:
-        logging.error(f"Error in background task: {str(e)}")
+        jobs.run(job_id)
+    finally:
+        memory_uploads.pop(job_id, None)
+        upload_memory.release(reserved)
+
+def notify_task(job_id, payload):
+    if not send_data_to_node_api(payload['url']):
+        raise RuntimeError("Failed to send data to Node.js API")
+
+# Upload dan notifikasi dicatat dulu di antrean SQLite sebelum dikerjakan,
+# supaya tidak hilang saat Firebase/Node API down atau worker di-restart
+JOB_LEASE = float(os.environ.get('JOB_LEASE', 120))
+jobs = JobQueue(
+    os.environ.get('JOB_QUEUE_PATH', os.path.join('queue', 'jobs.db')),
+    max_attempts=int(os.environ.get('JOB_MAX_ATTEMPTS', 8)),
+    base_delay=float(os.environ.get('JOB_RETRY_DELAY', 2)),
+    max_delay=float(os.environ.get('JOB_MAX_RETRY_DELAY', 600)),
+    lease=JOB_LEASE,
+)
+# Disimpan sebagai file supaya /annotated/<id> bisa dijawab worker gunicorn mana pun; default di tmpfs
+annotations = AnnotationStore(
+    os.environ.get('ANNOTATION_DIR') or tmpfs_dir('annotations'),
+    max_bytes=int(os.environ.get('ANNOTATION_STORE_BYTES', 64 * 1024 * 1024)),
+    ttl=float(os.environ.get('ANNOTATION_TTL', 600)),
+)
+
+roi_store = RoiStore()
+
+# Semua buffer upload yang sedang dibaca dibatasi totalnya, jadi RSS tidak ikut naik per request
+upload_buffers = BufferPool(int(os.environ.get('UPLOAD_BUFFER_BYTES', 256 * 1024 * 1024)))
+
+upload_memory = MemoryBudget(int(os.environ.get('UPLOAD_MEMORY_LIMIT', 256 * 1024 * 1024)))
+
+def spooled_paths(status=None):
+    return [payload[key] for payload in jobs.payloads('upload', status) for key in ('original_path', 'annotated_path') if payload.get(key)]
+
+# File upload yang menunggu retry; SPOOL_DIR bisa diarahkan ke tmpfs (mis. /dev/shm/sampahmas)
+spool = SpoolManager(
+    os.environ.get('SPOOL_DIR', 'tmp'),
+    max_bytes=int(os.environ.get('SPOOL_MAX_BYTES', 1024 * 1024 * 1024)),
+    max_files=int(os.environ.get('SPOOL_MAX_FILES', 10000)),
+    live_paths=spooled_paths,
+    dead_paths=lambda: spooled_paths('dead'),
+    protected=[jobs.path] + [jobs.path + suffix for suffix in ('-wal', '-shm', '-journal')],
+    orphan_age=float(os.environ.get('SPOOL_ORPHAN_AGE', 300)),
+    gc_interval=float(os.environ.get('SPOOL_GC_INTERVAL', 60)),
+)
+
+jobs.register('upload', background_task)
+jobs.register('notify', notify_task)
+jobs.start()
+spool.start()
+annotations.start()
+
+def submit_job(job_id):
+    # Dikerjakan langsung di upload pool; kalau pool penuh, job tetap tersimpan
+    # dan akan diambil oleh drainer JobQueue
+    try:
+        upload_pool.submit(jobs.run, job_id)
+    except QueueFullError:
+        logging.warning(f"Upload pool busy, job {job_id} left for the job queue")
+        jobs.run_later(job_id)
 
 @app.route('/')
 def home():
@@ -153,6 +295,234 @@ def home():
     </form>
     '''
 
+def queue_upload(annotation, meta):
+    # Gambar anotasi dirender di upload worker, bukan di jalur request
+    job_id = record_upload(annotation, meta)
+    size = upload_size_estimate(annotation)
+    if not upload_memory.try_reserve(size):
+        submit_job(job_id)
+        return
+    try:
+        upload_pool.submit(memory_upload_task, job_id, annotation, size)
+    except QueueFullError:
+        upload_memory.release(size)
+        jobs.run_later(job_id)
+
+def annotated_link(annotation_id):
+    return url_for('annotated_image', annotation_id=annotation_id)
+
+def handle_detection(filename, file_bytes, frame, full_size, bottle_found, percentage, inference_time, total_time, bottles,
+                     dispatch_upload=queue_upload, link=annotated_link):
+    # dispatch_upload/link diganti oleh entry point lain (asgi.py) yang tidak berjalan di dalam Flask
+    logging.info(f"DETEKSI ??")
+
+    # AnnotationStore menulis langsung dari memoryview ke file, tanpa salinan
+    extension = sniff_image_type(file_bytes) or '.jpg'
+    annotation_id = annotations.put(file_bytes, full_size, bottles, extension)
+    links = {}
+    if annotation_id is not None:
+        links = {"annotation_id": annotation_id, "annotated_url": link(annotation_id)}
+
+    frames_processed.inc(result='bottle' if bottle_found else 'empty')
+    if bottle_found:
+        logging.info(f"FOUND!!!!!!!! ??")
+        bottles_detected.inc(len(bottles))
+        # Hanya upload yang dikirim ke Firebase disalin: buffer pool dipakai ulang setelah request selesai
+        if isinstance(file_bytes, memoryview):
+            file_bytes = file_bytes.tobytes()
+        annotation = Annotation(file_bytes, full_size, bottles, extension, frame)
+        meta = {
+            "original_name": f"{uuid.uuid4()}_{filename}",
+            "annotated_name": f"annotated_{uuid.uuid4()}_{filename}",
+            "percentage": percentage,
+            "content_type": annotation.content_type,
+        }
+        dispatch_upload(annotation, meta)
+
+        return {
+            "message": "Bottle detected",
+            "status": True,
+            "confidence": percentage,
+            "count": len(bottles),
+            "bottles": [{"confidence": int(bottle["confidence"] * 100), "box": bottle["box"]} for bottle in bottles],
+            "Detection time": f"{inference_time:.4f} seconds",
+            "Total time": f"{total_time:.4f} seconds",
+            "detection_time": inference_time,
+            "total_time": total_time,
+            **links,
+        }
+
+    return {
+        "message": "No bottle detected",
+        "status": False,
+        "Detection time": f"{inference_time:.4f} seconds",
+        "Total time": f"{total_time:.4f} seconds",
+        "detection_time": inference_time,
+        "total_time": total_time,
+        **links,
+    }
+
+@app.errorhandler(IngestError)
+def handle_ingest_error(e):
+    return jsonify({"error": e.message}), e.status
+
+@app.errorhandler(QueueFullError)
+def handle_queue_full(e):
+    logging.warning(f"Rejecting upload: {e}")
+    retry_after = app.config['RETRY_AFTER']
+    return jsonify({"error": "Server busy, try again later", "retry_after": retry_after}), 503, {'Retry-After': str(retry_after)}
+
+# Cache per proses: capture yang dikirim ulang tidak diproses/di-upload dua kali
+result_cache = ResultCache(
+    max_entries=int(os.environ.get('RESULT_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('RESULT_CACHE_TTL', 300)),
+    perceptual=os.environ.get('RESULT_CACHE_PERCEPTUAL', '0') == '1',
+    max_distance=int(os.environ.get('RESULT_CACHE_MAX_DISTANCE', 4)),
+)
+
+def cached_detection(key, frame=None, scope=None):
+    # Tanpa frame hanya cek hash byte; dengan frame juga cek perceptual hash (hanya dalam scope yang sama)
+    if result_cache.max_entries <= 0:
+        return None, None
+    if frame is None:
+        body = result_cache.get(key)
+        return (None if body is None else {**body, "cached": True}), None
+    if not result_cache.perceptual:
+        return None, None
+    phash = perceptual_hash(frame)
+    body = result_cache.get_similar(phash, scope)
+    return (None if body is None else {**body, "cached": True}), phash
+
+def store_detection(key, phash, body, scope=None):
+    if result_cache.max_entries > 0:
+        result_cache.put(key, body, phash, scope)
+
+request_seconds = metrics.histogram('sampahmas_http_request_seconds', "HTTP request latency by endpoint")
+frames_processed = metrics.counter('sampahmas_frames_total', "Frames run through detection, by result")
+bottles_detected = metrics.counter('sampahmas_bottles_detected_total', "Bottles found across all frames")
+metrics.gauge('sampahmas_upload_queue_depth', "Tasks waiting in the upload pool", upload_pool.queue_depth)
+metrics.gauge('sampahmas_upload_memory_bytes', "Upload buffers held in memory", lambda: upload_memory.used)
+metrics.gauge('sampahmas_jobs_pending', "Durable jobs waiting to be retried", lambda: jobs.stats()['pending'])
+metrics.gauge('sampahmas_result_cache_hit_rate', "Share of uploads answered from the duplicate-frame cache", lambda: result_cache.stats()['hit_rate'])
+metrics.gauge('sampahmas_spool_bytes', "Bytes of spilled uploads on disk", lambda: spool.bytes)
+metrics.gauge('sampahmas_spool_files', "Spilled upload files on disk", lambda: spool.count)
+metrics.gauge('sampahmas_jobs_dead', "Durable jobs that exhausted their retries", lambda: jobs.stats()['dead'])
+
+@app.before_request
+def start_request_timer():
+    request.start_time = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    # Endpoint streaming (batch) hanya tercatat sampai header terkirim
+    start_time = getattr(request, 'start_time', None)
+    if start_time is not None and request.endpoint != 'metrics_endpoint':
+        request_seconds.observe(time.perf_counter() - start_time, endpoint=request.endpoint or 'unknown', status=response.status_code)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def stats_snapshot():
+    return {
+        "startup": startup.as_dict(),
+        "model": backend.stats(),
+        "batcher": batcher.stats() if batcher is not None else None,
+        "inference_pool": inference_pool.stats() if inference_pool is not None else None,
+        "upload_pool": upload_pool.stats(),
+        "jobs": jobs.stats(),
+        "upload_memory": upload_memory.stats(),
+        "upload_buffers": upload_buffers.stats(),
+        "notifier": notifier.stats(),
+        "result_cache": result_cache.stats(),
+        "annotations": annotations.stats(),
+        "cascade": gate.stats() if gate is not None else None,
+        "deposits": deposits.stats(),
+        "spool": spool.stats(),
+        "storage": uploader.stats(),
+    }
+
+@app.route('/stats')
+def stats():
+    return jsonify(stats_snapshot())
+
+def readiness():
+    # Readiness: hijau hanya setelah model dimuat dan di-warm-up
+    start_warm_up()
+    body = {
+        "ready": model.ready,
+        "model": model.status(),
+        "firebase": firebase.status(),
+        "startup": startup.as_dict(),
+    }
+    return body, 200 if model.ready else 503
+
+@app.route('/ready')
+def ready():
+    body, status = readiness()
+    return jsonify(body), status
+
+@app.route('/annotated/<annotation_id>')
+def annotated_image(annotation_id):
+    annotation = annotations.get(annotation_id)
+    if annotation is None:
+        return jsonify({"error": "Annotation not found or expired"}), 404
+    quality = request.args.get('quality', type=int)
+    if quality is not None:
+        quality = min(100, max(1, quality))
+    return Response(annotation.render(quality), mimetype=annotation.content_type)
+
+def request_machine_id():
+    return (request.form.get('vending_machine_id') or request.args.get('vending_machine_id')
+            or request.headers.get('X-Vending-Machine-Id'))
+
+def cache_scope(machine_id, roi):
+    # Hasil cache hanya berlaku untuk mesin dan ROI yang sama: hit dari mesin lain
+    # akan melewatkan upload + notifikasi deposit yang sebenarnya
+    scope = machine_id or ''
+    if roi is not None:
+        scope += f":{roi['x']},{roi['y']},{roi['width']},{roi['height']}"
+    return scope
+
+def cache_key(file_bytes, scope):
+    return f"{content_hash(file_bytes)}|{scope}"
+
+def run_detection(filename, file_bytes, machine_id=None, **handler_options):
+    # file_bytes boleh memoryview ke buffer pool; decode dan hash dilakukan tanpa menyalin
+    if sniff_image_type(file_bytes) is None:
+        return {"error": "Invalid file format. Only PNG and JPEG are accepted."}, 400
+
+    roi = roi_store.get(machine_id)
+    scope = cache_scope(machine_id, roi)
+    key = cache_key(file_bytes, scope)
+    cached, _ = cached_detection(key)
+    if cached is not None:
+        return cached, 200
+
+    with timed('decode'):
+        frame, full_size = decode_for_inference(file_bytes, region=inference_region(roi))
+    if frame is None:
+        return {"error": "Invalid image file"}, 400
+
+    cached, phash = cached_detection(key, frame, scope)
+    if cached is not None:
+        return cached, 200
+
+    upload_pool.ensure_capacity()
+
+    model.get()
+    result = detect_bottle_gated(frame, full_size, roi, machine_id)
+    body = handle_detection(filename, file_bytes, frame, full_size, *result, **handler_options)
+    if roi is not None:
+        body["roi"] = roi
+    store_detection(key, phash, body, scope)
+    return body, 200
+
+def detect_upload(filename, file_bytes, machine_id=None):
+    body, status = run_detection(filename, file_bytes, machine_id)
+    return jsonify(body), status
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     if 'imageFile' not in request.files:
@@ -162,51 +532,353 @@ def upload_file():
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
 
-    if file and file.filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-        file_bytes = file.read()
-        frame = cv2.imdecode(np.frombuffer(file_bytes, np.uint8), cv2.IMREAD_COLOR)
+    file_bytes = file.stream.view() if isinstance(file.stream, PooledUpload) else file.read()
+    return detect_upload(secure_filename(file.filename), file_bytes, request_machine_id())
+
+@app.route('/upload/raw', methods=['POST'])
+def upload_raw():
+    # Body request adalah gambarnya sendiri (image/jpeg atau image/png), tanpa multipart.
+    # Content-Length di atas MAX_CONTENT_LENGTH sudah ditolak sebelum body dibaca
+    upload = PooledUpload(upload_buffers, app.config['MAX_CONTENT_LENGTH'], request.content_length)
+    request.pooled_uploads.append(upload)
+    upload.read_from(request.stream)
+    filename = request.args.get('filename') or request.headers.get('X-Filename') or f"upload{upload.image_type}"
+    return detect_upload(secure_filename(filename), upload.view(), request_machine_id())
+
+# Satu deposit = beberapa frame dari satu kali memasukkan botol; upload dan notifikasi hanya sekali per deposit.
+# Disimpan sebagai file (default di tmpfs) supaya frame dan close bisa masuk ke worker gunicorn mana pun
+deposits = DepositStore(
+    os.environ.get('DEPOSIT_DIR') or tmpfs_dir('deposits'),
+    ttl=float(os.environ.get('DEPOSIT_TTL', 60)),
+    max_open=int(os.environ.get('DEPOSIT_MAX_OPEN', 1000)),
+    consensus=int(os.environ.get('DEPOSIT_CONSENSUS_FRAMES', 2)),
+    max_frames=int(os.environ.get('DEPOSIT_MAX_FRAMES', 5)),
+    iou_threshold=float(os.environ.get('DEPOSIT_IOU', 0.3)),
+)
+deposit_frames = metrics.counter('sampahmas_deposit_frames_total', "Frames sent to deposits, inferred or skipped after consensus")
+deposit_results = metrics.counter('sampahmas_deposits_total', "Closed deposits, by result")
+
+def open_deposit(machine_id=None):
+    deposit = deposits.open(machine_id)
+    return {
+        "deposit_id": deposit.id,
+        "ttl": deposits.ttl,
+        "consensus_frames": deposit.consensus,
+        "max_frames": deposit.max_frames,
+    }, 201
+
+def add_deposit_frame(deposit_id, filename, file_bytes):
+    with deposits.session(deposit_id) as deposit:
+        if deposit is None:
+            return {"error": "Deposit not found or expired"}, 404
+
+        # Sudah ada konsensus: frame berikutnya tidak di-decode maupun diinferensi
+        if deposit.verdict is not None:
+            deposit.skip()
+            deposit_frames.inc(result='skipped')
+            return {**deposit.summary(), "skipped": True}, 200
+
+        if sniff_image_type(file_bytes) is None:
+            return {"error": "Invalid file format. Only PNG and JPEG are accepted."}, 400
+        roi = roi_store.get(deposit.machine_id)
+        with timed('decode'):
+            frame, full_size = decode_for_inference(file_bytes, region=inference_region(roi))
         if frame is None:
-            return jsonify({"error": "Invalid image file"}), 400
-
-        if not os.path.exists("tmp"):
-            os.makedirs("tmp")
-
-        filename = secure_filename(file.filename)
-        original_file_path = os.path.join("tmp", filename)
-        with open(original_file_path, 'wb') as f:
-            f.write(file_bytes)
-
-        bottle_found, annotated_frame, percentage, inference_time, total_time = detect_bottle_and_draw(frame)
-        annotated_file_name = f"annotated_{uuid.uuid4()}_{filename}"
-        annotated_file_path = os.path.join("tmp", annotated_file_name)
-        cv2.imwrite(annotated_file_path, annotated_frame)
-        logging.info(f"DETEKSI ??")
-        
+            return {"error": "Invalid image file"}, 400
+
+        model.get()
+        bottle_found, percentage, inference_time, _, bottles = detect_bottle_gated(frame, full_size, roi, deposit.machine_id)
+        # Frame yang disimpan ditulis ke file deposit di akhir session, masih di dalam request ini
+        deposit.add((filename, file_bytes, full_size), bottle_found, inference_time, bottles)
+        deposit_frames.inc(result='inferred')
+        return {
+            **deposit.summary(),
+            "skipped": False,
+            "frame": {"bottle_found": bottle_found, "confidence": percentage, "count": len(bottles), "detection_time": inference_time},
+        }, 200
+
+def close_deposit(deposit_id, **handler_options):
+    # Deposit baru dihapus setelah upload-nya tercatat: kalau spool/antrean penuh (503),
+    # session keluar lewat exception, deposit tetap terbuka dan client bisa mengirim close lagi
+    with deposits.session(deposit_id) as deposit:
+        if deposit is None:
+            return {"error": "Deposit not found or expired"}, 404
+        if deposit.inferred == 0:
+            deposit.closed = True
+            deposit_results.inc(result='no_frames')
+            return {"error": "Deposit has no frames", **deposit.summary()}, 400
+
+        bottle_found = deposit.verdict
+        if bottle_found is None:
+            bottle_found = deposit.final_verdict()
         if bottle_found:
-            logging.info(f"FOUND!!!!!!!! ??")
-            unique_file_name = f"{uuid.uuid4()}_{filename}"
-            executor = ThreadPoolExecutor(max_workers=3)
-            executor.submit(background_task, original_file_path, annotated_file_path, unique_file_name, annotated_file_name, percentage)
-            executor.shutdown(wait=False)
-
-            return jsonify({
-                "message": "Bottle detected",
-                "status": True,
-                "confidence": percentage,
-                "Detection time": f"{inference_time:.4f} seconds",
-                "Total time": f"{total_time:.4f} seconds"
-            }), 200
-
+            (filename, _, full_size), bottles = deposit.best
+            file_bytes = deposits.frame_bytes(deposit, 'best')
+            percentage = int(bottles[0]["confidence"] * 100)
         else:
-            return jsonify({
-                "message": "No bottle detected",
-                "status": False,
-                "Detection time": f"{inference_time:.4f} seconds",
-                "Total time": f"{total_time:.4f} seconds"
-            }), 200
-
+            (filename, _, full_size), bottles, percentage = deposit.last_empty, [], 0
+            file_bytes = deposits.frame_bytes(deposit, 'last_empty')
+
+        # Frame terbaik dari deposit diproses seperti satu /upload biasa
+        body = handle_detection(filename, file_bytes, None, full_size, bottle_found, percentage,
+                                deposit.inference_time, time.time() - deposit.opened, bottles, **handler_options)
+        deposit.closed = True
+        deposit_results.inc(result='bottle' if bottle_found else 'empty')
+        body["deposit"] = deposit.summary()
+        return body, 200
+
+@app.route('/deposits', methods=['POST'])
+def deposit_open():
+    body, status = open_deposit(request_machine_id())
+    return jsonify(body), status
+
+@app.route('/deposits/<deposit_id>', methods=['GET'])
+def deposit_status(deposit_id):
+    deposit = deposits.get(deposit_id)
+    if deposit is None:
+        return jsonify({"error": "Deposit not found or expired"}), 404
+    return jsonify(deposit.summary())
+
+@app.route('/deposits/<deposit_id>/frames', methods=['POST'])
+def deposit_frame(deposit_id):
+    # Multipart dengan field imageFile seperti /upload, atau body mentah seperti /upload/raw
+    if request.mimetype == 'multipart/form-data':
+        file = request.files.get('imageFile')
+        if file is None or file.filename == '':
+            return jsonify({"error": "No image file provided"}), 400
+        filename = file.filename
+        file_bytes = file.stream.view() if isinstance(file.stream, PooledUpload) else file.read()
     else:
-        return jsonify({"error": "Invalid file format. Only PNG and JPEG are accepted."}), 400
+        upload = PooledUpload(upload_buffers, app.config['MAX_CONTENT_LENGTH'], request.content_length)
+        request.pooled_uploads.append(upload)
+        upload.read_from(request.stream)
+        filename = request.args.get('filename') or request.headers.get('X-Filename') or f"upload{upload.image_type}"
+        file_bytes = upload.view()
+    body, status = add_deposit_frame(deposit_id, secure_filename(filename), file_bytes)
+    return jsonify(body), status
+
+@app.route('/deposits/<deposit_id>/close', methods=['POST'])
+def deposit_close(deposit_id):
+    body, status = close_deposit(deposit_id)
+    return jsonify(body), status
+
+def admin_error():
+    # Perubahan konfigurasi ditolak selama token admin belum diset
+    token = os.environ.get('ADMIN_TOKEN') or os.environ.get('ROI_ADMIN_TOKEN')
+    if not token:
+        return jsonify({"error": "Admin token not configured (set ADMIN_TOKEN)"}), 403
+    if request.headers.get('Authorization') != f"Bearer {token}":
+        return jsonify({"error": "Unauthorized"}), 401
+    return None
+
+@app.route('/roi', methods=['GET'])
+def list_rois():
+    return jsonify(roi_store.all())
+
+@app.route('/roi/<machine_id>', methods=['GET', 'PUT', 'DELETE'])
+def machine_roi(machine_id):
+    if request.method == 'GET':
+        roi = roi_store.get(machine_id)
+        if roi is None:
+            return jsonify({"error": "No ROI configured for this machine"}), 404
+        return jsonify(roi)
+
+    denied = admin_error()
+    if denied:
+        return denied
+    if request.method == 'DELETE':
+        if not roi_store.delete(machine_id):
+            return jsonify({"error": "No ROI configured for this machine"}), 404
+        return jsonify({"deleted": machine_id})
+
+    try:
+        roi = roi_store.set(machine_id, request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(roi)
+
+@app.route('/cascade/<machine_id>/reference', methods=['PUT', 'DELETE'])
+def cascade_reference(machine_id):
+    # PUT: body = foto chute kosong (image/jpeg atau image/png) sebagai referensi
+    if gate is None:
+        return jsonify({"error": "Cascade is disabled (CASCADE_THRESHOLD=0)"}), 404
+    denied = admin_error()
+    if denied:
+        return denied
+    if request.method == 'DELETE':
+        return jsonify({"reset": gate.reset(machine_id)})
+
+    upload = PooledUpload(upload_buffers, app.config['MAX_CONTENT_LENGTH'], request.content_length)
+    request.pooled_uploads.append(upload)
+    upload.read_from(request.stream)
+    frame, _ = decode_for_inference(upload.view())
+    if frame is None:
+        return jsonify({"error": "Invalid image file"}), 400
+    roi = roi_store.get(machine_id)
+    gate.set_reference(machine_id, frame if roi is None else crop(frame, roi))
+    return jsonify({"machine_id": machine_id, "reference": "set"})
+
+ARCHIVE_TYPES = ('application/zip', 'application/x-zip-compressed', 'application/x-tar', 'application/gzip', 'application/x-gzip')
+
+def iter_archive_items(stream, max_item_size, name=''):
+    # Zip butuh file yang bisa di-seek, tar bisa dibaca langsung dari stream
+    spooled = tempfile.SpooledTemporaryFile(max_size=max_item_size)
+    shutil.copyfileobj(stream, spooled)
+    spooled.seek(0)
+
+    # Header 200 sudah terkirim saat arsip dibaca: arsip rusak dilaporkan sebagai satu record error
+    try:
+        if zipfile.is_zipfile(spooled):
+            spooled.seek(0)
+            with zipfile.ZipFile(spooled) as archive:
+                for info in archive.infolist():
+                    if info.is_dir():
+                        continue
+                    if info.file_size > max_item_size:
+                        yield info.filename, None, "File too large"
+                        continue
+                    yield info.filename, archive.read(info), None
+            return
+
+        spooled.seek(0)
+        with tarfile.open(fileobj=spooled, mode='r|*') as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                if member.size > max_item_size:
+                    yield member.name, None, "File too large"
+                    continue
+                yield member.name, archive.extractfile(member).read(), None
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError, zlib.error, NotImplementedError) as e:
+        yield name, None, f"Invalid archive: {e}"
+
+def iter_batch_items(max_item_size):
+    if request.mimetype in ARCHIVE_TYPES:
+        yield from iter_archive_items(request.stream, max_item_size)
+        return
+
+    for file in request.files.getlist('archive'):
+        yield from iter_archive_items(file.stream, max_item_size, file.filename)
+
+    for file in request.files.getlist('imageFile'):
+        if file.filename == '':
+            yield file.filename, None, "No selected file"
+            continue
+        file_bytes = file.read(max_item_size + 1)
+        if len(file_bytes) > max_item_size:
+            yield file.filename, None, "File too large"
+            continue
+        yield file.filename, file_bytes, None
+
+def process_batch(items, roi=None, machine_id=None):
+    scope = cache_scope(machine_id, roi)
+    decoded = []
+    for index, name, file_bytes, error in items:
+        if error is None and sniff_image_type(file_bytes) is None:
+            error = "Invalid file format. Only PNG and JPEG are accepted."
+        if error is not None:
+            yield {"index": index, "filename": name, "error": error}
+            continue
+
+        key = cache_key(file_bytes, scope)
+        cached, _ = cached_detection(key)
+        if cached is None:
+            with timed('decode'):
+                frame, full_size = decode_for_inference(file_bytes, region=inference_region(roi))
+            if frame is None:
+                yield {"index": index, "filename": name, "error": "Invalid image file"}
+                continue
+            cached, phash = cached_detection(key, frame, scope)
+        if cached is not None:
+            yield {"index": index, "filename": name, **cached}
+            continue
+        decoded.append((index, name, file_bytes, frame, full_size, key, phash))
+
+    if not decoded:
+        return
+
+    model.get()
+    results = detect_bottles_gated([item[3] for item in decoded], [item[4] for item in decoded], [roi] * len(decoded), machine_id)
+    for (index, name, file_bytes, frame, full_size, key, phash), result in zip(decoded, results):
+        filename = secure_filename(os.path.basename(name))
+        body = handle_detection(filename, file_bytes, frame, full_size, *result)
+        if roi is not None:
+            body["roi"] = roi
+        store_detection(key, phash, body, scope)
+        yield {"index": index, "filename": name, **body}
+
+def batch_records(items, roi=None, machine_id=None):
+    # Kegagalan di tengah batch tidak bisa jadi status HTTP lagi: item yang belum dilaporkan diberi record error
+    reported = set()
+    try:
+        for record in process_batch(items, roi, machine_id):
+            reported.add(record["index"])
+            yield record
+        return
+    except QueueFullError as e:
+        logging.warning(f"Rejecting batch items: {e}")
+        error = {"error": "Server busy, try again later", "retry_after": app.config['RETRY_AFTER']}
+    except Exception:
+        logging.exception("Error processing batch items")
+        error = {"error": "Internal server error"}
+    for index, name, _, _ in items:
+        if index not in reported:
+            yield {"index": index, "filename": name, **error}
+
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    max_item_size = app.config['MAX_CONTENT_LENGTH']
+    batch_size = app.config['UPLOAD_BATCH_SIZE']
+    # Tolak dengan 503 selagi header belum terkirim
+    upload_pool.ensure_capacity()
+
+    def generate():
+        # Form baru di-parse di dalam generator; kalau di-parse di view, file
+        # upload sudah ditutup saat context request pertama di-pop
+        machine_id = request_machine_id()
+        roi = roi_store.get(machine_id)
+        pending = []
+        for index, (name, file_bytes, error) in enumerate(iter_batch_items(max_item_size)):
+            pending.append((index, name, file_bytes, error))
+            if len(pending) >= batch_size:
+                for record in batch_records(pending, roi, machine_id):
+                    yield json.dumps(record) + "\n"
+                pending = []
+        for record in batch_records(pending, roi, machine_id):
+            yield json.dumps(record) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+_warm_up_lock = threading.Lock()
+_warm_up_thread = None
+
+def warm_up():
+    try:
+        model.get()
+    except Exception:
+        logging.exception("Model warm-up failed")
+    if os.environ.get('FIREBASE_EAGER_INIT', '1') == '1':
+        try:
+            firebase.get()
+        except Exception:
+            logging.warning("Firebase not initialized yet, will retry on first upload")
+    logging.info(f"Startup report: {startup.as_dict()}")
+
+def start_warm_up():
+    # Model dan Firebase disiapkan di background; request yang datang lebih dulu
+    # menunggu inisialisasi yang sama lewat LazyResource
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _warm_up_thread is None or (not _warm_up_thread.is_alive() and not model.ready):
+            _warm_up_thread = threading.Thread(target=warm_up, name="WarmUp", daemon=True)
+            _warm_up_thread.start()
+
+def create_app():
+    # Entry point untuk gunicorn: gunicorn 'main:create_app()'
+    start_warm_up()
+    return app
+
+startup.record('imports', time.perf_counter() - _import_start)
 
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
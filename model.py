@@ -0,0 +1,79 @@
+import cv2
+import numpy as np
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+PROTOTXT_PATH = os.environ.get('MODEL_PROTOTXT', 'MobileNetSSD_deploy.prototxt')
+WEIGHTS_PATH = os.environ.get('MODEL_WEIGHTS', 'MobileNetSSD_deploy.caffemodel')
+
+INPUT_SIZE = (300, 300)
+SCALE_FACTOR = 0.007843
+MEAN = 127.5
+
+CLASSES = ["background", "aeroplane", "bicycle", "bird", "boat",
+           "bottle", "bus", "car", "cat", "chair", "cow", "diningtable",
+           "dog", "horse", "motorbike", "person", "pottedplant", "sheep",
+           "sofa", "train", "tvmonitor"]
+
+
+class ModelRegistry:
+    # File model dibaca sekali per proses; tiap thread inferensi meminjam Net sendiri
+    # supaya setInput()/forward() tidak saling balapan
+
+    def __init__(self, prototxt_path=PROTOTXT_PATH, weights_path=WEIGHTS_PATH):
+        self.prototxt_path = prototxt_path
+        self.weights_path = weights_path
+        self._lock = threading.Lock()
+        self._prototxt = None
+        self._weights = None
+        self._idle = []
+        self.copies = 0
+        self.load_time = None
+
+    def _build(self):
+        return cv2.dnn.readNetFromCaffe(self._prototxt, self._weights)
+
+    def load(self):
+        with self._lock:
+            if self._weights is not None:
+                return
+            start_time = time.perf_counter()
+            with open(self.prototxt_path, 'rb') as f:
+                self._prototxt = np.frombuffer(f.read(), np.uint8)
+            with open(self.weights_path, 'rb') as f:
+                self._weights = np.frombuffer(f.read(), np.uint8)
+            self._idle.append(self._build())
+            self.copies = 1
+            self.load_time = time.perf_counter() - start_time
+        logging.info(f"Model loaded in {self.load_time:.4f} seconds")
+
+    @contextmanager
+    def acquire(self):
+        self.load()
+        with self._lock:
+            net = self._idle.pop() if self._idle else None
+        if net is None:
+            net = self._build()
+            with self._lock:
+                self.copies += 1
+            logging.info(f"Created model copy #{self.copies}")
+        try:
+            yield net
+        finally:
+            with self._lock:
+                self._idle.append(net)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loaded": self._weights is not None,
+                "load_time": self.load_time,
+                "copies": self.copies,
+                "idle": len(self._idle),
+            }
+
+
+registry = ModelRegistry()
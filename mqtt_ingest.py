@@ -0,0 +1,207 @@
+import base64
+import binascii
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from collections import deque
+
+import paho.mqtt.client as mqtt
+
+from backends import backend
+from decode import decode_for_inference
+from detector import detect_bottle_gated, inference_pool, inference_region
+from roi import RoiStore
+from workers import QueueFullError, WorkerPool
+
+logging.basicConfig(level=logging.INFO)
+
+MQTT_BROKER = os.environ.get('MQTT_BROKER', 'ge9c6717.ala.asia-southeast1.emqxsl.com')
+MQTT_PORT = int(os.environ.get('MQTT_PORT', 8883))
+MQTT_TOPIC = os.environ.get('MQTT_TOPIC', 'vending_machine/image')
+MQTT_QOS = int(os.environ.get('MQTT_QOS', 1))
+# {vending_machine_id} diganti dengan id mesin pengirim; pesan boleh menentukan "reply_to" sendiri
+MQTT_REPLY_TOPIC = os.environ.get('MQTT_REPLY_TOPIC', 'vending_machine/result/{vending_machine_id}')
+MQTT_USERNAME = os.environ.get('MQTT_USERNAME')
+MQTT_PASSWORD = os.environ.get('MQTT_PASSWORD')
+MQTT_TLS = os.environ.get('MQTT_TLS', '1') == '1'
+MQTT_CLIENT_ID = os.environ.get('MQTT_CLIENT_ID', 'sampahmas-ingest')
+
+
+class MqttIngestService:
+    # Pesan langsung dipindah dari thread jaringan paho ke worker pool terbatas. QoS 0 dibuang
+    # kalau pool penuh; QoS 1/2 tidak pernah dibuang, menunggu di daftar tunda dan baru di-ack
+    # setelah diproses, jadi window in-flight broker yang menahan pengiriman
+
+    def __init__(self, client, manual_ack, workers=4, queue_size=32, reply_topic=MQTT_REPLY_TOPIC):
+        self.client = client
+        self.manual_ack = manual_ack
+        self.reply_topic = reply_topic
+        self.rois = RoiStore()
+        self.pool = WorkerPool(max_workers=workers, max_queue=queue_size, name="MqttIngest")
+        self._deferred = deque()
+        self._deferred_ready = threading.Event()
+        self._lock = threading.Lock()
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+
+        threading.Thread(target=self._feed_deferred, name="MqttDeferred", daemon=True).start()
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc == 0:
+            logging.info("Connected to MQTT broker!")
+            client.subscribe(MQTT_TOPIC, qos=MQTT_QOS)
+            logging.info(f"Subscribed to topic: {MQTT_TOPIC}")
+        else:
+            logging.error(f"Failed to connect, return code {rc}")
+
+    def on_message(self, client, userdata, msg):
+        with self._lock:
+            self.received += 1
+        try:
+            self.pool.submit(self.process, msg)
+        except QueueFullError:
+            if msg.qos == 0:
+                with self._lock:
+                    self.dropped += 1
+                logging.warning(f"Ingest queue full, dropped QoS 0 message on {msg.topic}")
+            else:
+                with self._lock:
+                    self._deferred.append(msg)
+                self._deferred_ready.set()
+
+    def _feed_deferred(self):
+        while True:
+            self._deferred_ready.wait()
+            while True:
+                with self._lock:
+                    if not self._deferred:
+                        self._deferred_ready.clear()
+                        break
+                    msg = self._deferred[0]
+                try:
+                    self.pool.submit(self.process, msg)
+                except QueueFullError:
+                    time.sleep(0.05)
+                    continue
+                with self._lock:
+                    self._deferred.popleft()
+
+    def _ack(self, msg):
+        if self.manual_ack and msg.qos > 0:
+            self.client.ack(msg.mid, msg.qos)
+
+    def process(self, msg):
+        try:
+            self._process(msg)
+            with self._lock:
+                self.processed += 1
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            logging.error(f"Failed to process message: {e}")
+        finally:
+            # Pesan rusak tetap di-ack supaya tidak dikirim ulang terus-menerus
+            self._ack(msg)
+
+    def _process(self, msg):
+        data = json.loads(msg.payload)
+        vending_machine_id = data.get("vending_machine_id")
+        image_base64 = data.get("image")
+        if not vending_machine_id or not image_base64:
+            raise ValueError("Invalid message format or missing fields")
+
+        try:
+            image_data = base64.b64decode(image_base64)
+        except binascii.Error as e:
+            raise ValueError(f"Failed to decode Base64 image: {e}")
+
+        roi = self.rois.get(vending_machine_id)
+        frame, full_size = decode_for_inference(image_data, region=inference_region(roi))
+        if frame is None:
+            raise ValueError("Invalid image data")
+
+        bottle_found, percentage, inference_time, total_time, bottles = detect_bottle_gated(frame, full_size, roi, vending_machine_id)
+
+        result = {
+            "vending_machine_id": vending_machine_id,
+            "request_id": data.get("request_id"),
+            "status": bottle_found,
+            "message": "Bottle detected" if bottle_found else "No bottle detected",
+            "confidence": percentage,
+            "count": len(bottles),
+            "bottles": [{"confidence": int(bottle["confidence"] * 100), "box": bottle["box"]} for bottle in bottles],
+            "detection_time": inference_time,
+            "total_time": total_time,
+        }
+        reply_topic = data.get("reply_to") or self.reply_topic.format(vending_machine_id=vending_machine_id)
+        self.client.publish(reply_topic, json.dumps(result), qos=min(msg.qos, 1))
+        logging.info(f"Result for {vending_machine_id} published to {reply_topic}: {result['message']}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "received": self.received,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "deferred": len(self._deferred),
+                "pool": self.pool.stats(),
+            }
+
+
+def create_client():
+    kwargs = {"client_id": MQTT_CLIENT_ID, "clean_session": False}
+    manual_ack = hasattr(mqtt, 'CallbackAPIVersion')
+    if manual_ack:
+        # paho-mqtt 2.x: ack manual supaya QoS 1/2 baru di-ack setelah diproses
+        kwargs["callback_api_version"] = mqtt.CallbackAPIVersion.VERSION1
+        kwargs["manual_ack"] = True
+    client = mqtt.Client(**kwargs)
+    if MQTT_USERNAME:
+        client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+    if MQTT_TLS:
+        client.tls_set()  # Gunakan sertifikat root default dari OS
+    return client, manual_ack
+
+
+def main():
+    if inference_pool is not None:
+        inference_pool.start()
+    else:
+        backend.load()
+
+    client, manual_ack = create_client()
+    service = MqttIngestService(
+        client,
+        manual_ack,
+        workers=int(os.environ.get('MQTT_WORKERS', 4)),
+        queue_size=int(os.environ.get('MQTT_QUEUE_SIZE', 32)),
+    )
+    if not service.manual_ack:
+        logging.warning("paho-mqtt without manual_ack support: QoS 1/2 messages are acknowledged on receipt")
+    client.on_connect = service.on_connect
+    client.on_message = service.on_message
+
+    def handle_sigterm(signum, frame):
+        logging.info(f"Stopping MQTT ingestion: {service.stats()}")
+        client.disconnect()
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+    client.connect(MQTT_BROKER, MQTT_PORT, 60)
+    try:
+        # Loop jaringan berjalan di thread utama, tidak ada busy-wait
+        client.loop_forever()
+    except KeyboardInterrupt:
+        client.disconnect()
+    service.pool.shutdown(wait=True, timeout=float(os.environ.get('MQTT_DRAIN_TIMEOUT', 25)))
+    logging.info("MQTT client stopped")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.last_error = None
+
+    def record(self, latency, error=None):
+        self.requests += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        if error is not None:
+            self.failures += 1
+            self.last_error = error
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "mean_latency": self.total_latency / self.requests if self.requests else 0,
+            "max_latency": self.max_latency,
+            "last_error": self.last_error,
+        }
+
+
+class Notifier:
+    # Kirim notifikasi ke API Node.js lewat satu session keep-alive. Kalau batch_url diisi,
+    # notifikasi dalam rentang batch_window_ms digabung jadi satu POST {"message", "items"}
+
+    def __init__(self, url, batch_url=None, connect_timeout=3.05, read_timeout=10,
+                 retries=2, pool_size=10, batch_window_ms=50, max_batch_size=50):
+        self.url = url
+        self.batch_url = batch_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+
+        self.session = requests.Session()
+        # Hanya gagal connect yang diulang (request belum terkirim). POST tidak idempoten,
+        # jadi read timeout/5xx diserahkan ke job 'notify' di JobQueue
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=0,
+            other=0,
+            backoff_factor=0.3,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._pending = []
+        self._flush_timer = None
+
+    def _post(self, url, data):
+        start_time = time.perf_counter()
+        error = None
+        try:
+            response = self.session.post(url, json=data, timeout=self.timeout)
+            if response.status_code != 200:
+                error = f"HTTP {response.status_code}"
+        except requests.exceptions.RequestException as e:
+            error = str(e)
+        latency = time.perf_counter() - start_time
+
+        with self._lock:
+            self._stats.setdefault(url, EndpointStats()).record(latency, error)
+        if error is not None:
+            logging.error(f"Failed to send data to Node.js API ({url}): {error}")
+            return False
+        return True
+
+    def send(self, data):
+        # True kalau notifikasi sudah diterima API
+        if not self.batch_url:
+            return self._post(self.url, data)
+        return self._enqueue(data).result()
+
+    def _enqueue(self, data):
+        future = Future()
+        with self._lock:
+            self._pending.append((data, future))
+            if len(self._pending) >= self.max_batch_size:
+                batch, self._pending = self._pending, []
+            else:
+                batch = None
+                if self._flush_timer is None:
+                    self._flush_timer = threading.Timer(self.batch_window, self._flush)
+                    self._flush_timer.daemon = True
+                    self._flush_timer.start()
+        if batch is not None:
+            self._send_batch(batch)
+        return future
+
+    def _flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+            self._flush_timer = None
+        if batch:
+            self._send_batch(batch)
+
+    def _send_batch(self, batch):
+        try:
+            if len(batch) == 1:
+                ok = self._post(self.url, batch[0][0])
+            else:
+                ok = self._post(self.batch_url, {"message": "Bottles detected", "items": [data for data, _ in batch]})
+        except Exception as e:
+            logging.error(f"Error sending notification batch: {str(e)}")
+            ok = False
+        for _, future in batch:
+            future.set_result(ok)
+
+    def stats(self):
+        with self._lock:
+            return {url: stats.as_dict() for url, stats in self._stats.items()}
@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+import threading
+import time
+
+ROI_CONFIG_PATH = os.environ.get('ROI_CONFIG_PATH', 'roi.json')
+
+
+def parse_roi(data):
+    # ROI berupa pecahan frame ({"x", "y", "width", "height"} 0..1), jadi berlaku di resolusi decode apa pun
+    try:
+        x, y, width, height = (float(data[key]) for key in ('x', 'y', 'width', 'height'))
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("ROI must have numeric x, y, width and height")
+    if not (0 <= x < 1 and 0 <= y < 1 and 0 < width <= 1 and 0 < height <= 1):
+        raise ValueError("ROI values must be fractions of the frame between 0 and 1")
+    if x + width > 1.0001 or y + height > 1.0001:
+        raise ValueError("ROI must lie inside the frame")
+    return {"x": x, "y": y, "width": min(width, 1 - x), "height": min(height, 1 - y)}
+
+
+def roi_pixels(roi, size):
+    # (x, y, width, height) dalam piksel untuk frame berukuran (width, height)
+    frame_width, frame_height = size
+    x = int(round(roi["x"] * frame_width))
+    y = int(round(roi["y"] * frame_height))
+    width = max(1, min(frame_width - x, int(round(roi["width"] * frame_width))))
+    height = max(1, min(frame_height - y, int(round(roi["height"] * frame_height))))
+    return x, y, width, height
+
+
+def crop(frame, roi):
+    # View ke frame, tidak ada piksel yang disalin
+    x, y, width, height = roi_pixels(roi, (frame.shape[1], frame.shape[0]))
+    return frame[y:y + height, x:x + width]
+
+
+class RoiStore:
+    # Area crop per vending_machine_id, disimpan sebagai JSON. Semua proses membaca file yang sama
+    # dan melihat perubahan dari proses lain dalam check_interval detik, tanpa restart
+
+    def __init__(self, path=ROI_CONFIG_PATH, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._rois = {}
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._reload()
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self._rois, self._mtime = {}, None
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path) as f:
+                rois = {str(machine_id): parse_roi(roi) for machine_id, roi in json.load(f).items()}
+        except (OSError, ValueError, AttributeError) as e:
+            logging.error(f"Ignoring invalid ROI config {self.path}: {e}")
+            return
+        self._rois, self._mtime = rois, mtime
+        logging.info(f"Loaded {len(rois)} ROI(s) from {self.path}")
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._checked >= self.check_interval:
+            self._checked = now
+            self._reload()
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._rois, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def get(self, machine_id):
+        if machine_id is None:
+            return None
+        with self._lock:
+            self._refresh()
+            return self._rois.get(str(machine_id))
+
+    def all(self):
+        with self._lock:
+            self._refresh()
+            return dict(self._rois)
+
+    def set(self, machine_id, data):
+        roi = parse_roi(data)
+        with self._lock:
+            self._reload()
+            self._rois[str(machine_id)] = roi
+            self._save()
+        logging.info(f"ROI for {machine_id} set to {roi}")
+        return roi
+
+    def delete(self, machine_id):
+        with self._lock:
+            self._reload()
+            removed = self._rois.pop(str(machine_id), None)
+            if removed is not None:
+                self._save()
+        return removed is not None
@@ -0,0 +1,185 @@
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from workers import QueueFullError
+
+
+class MemoryBudget:
+    # Batas byte buffer upload di memori; yang tidak kebagian di-spill ke disk
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.spills = 0
+        self._lock = threading.Lock()
+
+    def try_reserve(self, size):
+        with self._lock:
+            if self.used + size > self.limit:
+                self.spills += 1
+                return False
+            self.used += size
+            return True
+
+    def release(self, size):
+        with self._lock:
+            self.used = max(0, self.used - size)
+
+    def stats(self):
+        with self._lock:
+            return {"used": self.used, "limit": self.limit, "spills": self.spills}
+
+
+class SpoolManager:
+    # File yang harus bertahan melewati request (upload yang di-spill menunggu retry), bisa di tmpfs.
+    # Ditulis dengan nama unik lalu di-rename setelah lengkap. Total byte dan jumlah file dibatasi:
+    # kalau penuh, orphan (tidak dirujuk job) dihapus dulu, lalu file job 'dead'; file job yang
+    # masih akan jalan tidak pernah dihapus, tulisan ditolak dengan QueueFullError.
+    # live_paths() = path yang dirujuk job, dead_paths() = yang job-nya sudah menyerah;
+    # path di `protected` (mis. database job) tidak disentuh
+
+    def __init__(self, directory, max_bytes, max_files, live_paths=None, dead_paths=None, protected=(),
+                 orphan_age=300.0, gc_interval=60.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.live_paths = live_paths or set
+        self.dead_paths = dead_paths or set
+        self.protected = {os.path.abspath(path) for path in protected}
+        self.orphan_age = orphan_age
+        self.gc_interval = gc_interval
+        self._files = OrderedDict()
+        self.bytes = 0
+        self.written = 0
+        self.evicted = 0
+        self.collected = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    @property
+    def count(self):
+        return len(self._files)
+
+    def _scan(self):
+        # Index ulang dari disk: file dari proses lain ikut terhitung
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file(follow_symlinks=False) or os.path.abspath(entry.path) in self.protected:
+                continue
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, entry.path, stat.st_size))
+        files.sort()
+        self._files = OrderedDict((path, (size, mtime)) for mtime, path, size in files)
+        self.bytes = sum(size for size, _ in self._files.values())
+
+    def _remove(self, path):
+        size, _ = self._files.pop(path, (0, 0))
+        self.bytes -= size
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _orphans(self, live, now):
+        return [path for path, (_, mtime) in self._files.items()
+                if path not in live and now - mtime >= self.orphan_age]
+
+    def _make_room(self, size):
+        if self.bytes + size <= self.max_bytes and len(self._files) < self.max_files:
+            return
+        live = {os.path.abspath(path) for path in self.live_paths()}
+        dead = {os.path.abspath(path) for path in self.dead_paths()}
+        candidates = self._orphans(live, time.time()) + [path for path in self._files if path in dead]
+        for path in candidates:
+            if self.bytes + size <= self.max_bytes and len(self._files) < self.max_files:
+                return
+            if path in self._files:
+                logging.warning(f"Spool full, evicting {path}")
+                self._remove(path)
+                self.evicted += 1
+        if self.bytes + size > self.max_bytes or len(self._files) >= self.max_files:
+            # Sisanya milik job yang masih akan jalan: tolak, jangan hapus
+            self.rejected += 1
+            raise QueueFullError(f"Spool full ({len(self._files)} files, {self.bytes} bytes), cannot fit {size} bytes")
+
+    def write(self, name, data):
+        if len(data) > self.max_bytes:
+            with self._lock:
+                self.rejected += 1
+            raise QueueFullError(f"{len(data)} bytes do not fit in the spool ({self.max_bytes} bytes)")
+        path = os.path.abspath(os.path.join(self.directory, f"{uuid.uuid4().hex}_{name}"))
+        partial = f"{path}.part"
+        with self._lock:
+            self._make_room(len(data))
+            with open(partial, 'wb') as f:
+                f.write(data)
+            os.replace(partial, path)
+            self._files[path] = (len(data), time.time())
+            self.bytes += len(data)
+            self.written += 1
+        logging.info(f"Spilled {len(data)} bytes to {path}")
+        return path
+
+    def remove(self, path):
+        with self._lock:
+            self._remove(os.path.abspath(path))
+
+    def collect(self):
+        # Hapus orphan yang sudah cukup tua; dipanggil saat start dan oleh timer
+        live = {os.path.abspath(path) for path in self.live_paths()}
+        with self._lock:
+            self._scan()
+            orphans = self._orphans(live, time.time())
+            for path in orphans:
+                self._remove(path)
+            self.collected += len(orphans)
+        if orphans:
+            logging.info(f"Removed {len(orphans)} orphaned file(s) from {self.directory}")
+        return len(orphans)
+
+    def _gc_loop(self):
+        while not self._stopping.wait(self.gc_interval):
+            try:
+                self.collect()
+            except Exception as e:
+                logging.error(f"Error collecting spool {self.directory}: {str(e)}")
+
+    def start(self):
+        if self._thread is None:
+            self.collect()
+            self._thread = threading.Thread(target=self._gc_loop, name="SpoolGC", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "directory": self.directory,
+                "files": len(self._files),
+                "bytes": self.bytes,
+                "max_files": self.max_files,
+                "max_bytes": self.max_bytes,
+                "written": self.written,
+                "evicted": self.evicted,
+                "collected": self.collected,
+                "rejected": self.rejected,
+            }
+        try:
+            stats["disk_free"] = shutil.disk_usage(self.directory).free
+        except OSError:
+            stats["disk_free"] = None
+        return stats
@@ -0,0 +1,82 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StartupReport:
+    # Waktu tiap fase startup, urut sesuai selesainya
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self._phases = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, phase, seconds, error=None):
+        with self._lock:
+            self._phases[phase] = seconds
+            if error is not None:
+                self._errors[phase] = error
+        if error is None:
+            logging.info(f"Startup phase '{phase}' took {seconds:.4f} seconds")
+        else:
+            logging.error(f"Startup phase '{phase}' failed after {seconds:.4f} seconds: {error}")
+
+    @contextmanager
+    def phase(self, name):
+        start_time = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.record(name, time.perf_counter() - start_time, str(e))
+            raise
+        self.record(name, time.perf_counter() - start_time)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "phases": dict(self._phases),
+                "errors": dict(self._errors),
+                "since_start": time.perf_counter() - self.started,
+            }
+
+
+class LazyResource:
+    # Resource mahal dibuat saat pertama dipakai. Pemanggil bersamaan menunggu inisialisasi yang
+    # sama; percobaan yang gagal tidak di-cache, jadi pemanggil berikutnya mencoba lagi
+    def __init__(self, name, factory, report=None):
+        self.name = name
+        self.factory = factory
+        self.report = report
+        self._value = None
+        self._ready = False
+        self._lock = threading.Lock()
+        self.last_error = None
+
+    @property
+    def ready(self):
+        return self._ready
+
+    def get(self):
+        if self._ready:
+            return self._value
+        with self._lock:
+            if self._ready:
+                return self._value
+            start_time = time.perf_counter()
+            try:
+                value = self.factory()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                if self.report is not None:
+                    self.report.record(self.name, time.perf_counter() - start_time, self.last_error)
+                raise
+            if self.report is not None:
+                self.report.record(self.name, time.perf_counter() - start_time)
+            self._value = value
+            self.last_error = None
+            self._ready = True
+            return value
+
+    def status(self):
+        return {"ready": self._ready, "error": self.last_error}
@@ -0,0 +1,120 @@
+import logging
+import os
+import pathlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import timed
+
+STORAGE_PUBLIC = os.environ.get('STORAGE_PUBLIC', '1') == '1'
+STORAGE_CACHE_CONTROL = os.environ.get('STORAGE_CACHE_CONTROL', 'public, max-age=31536000, immutable')
+# Di atas ini upload memakai sesi resumable per chunk (chunk harus kelipatan 256 KB)
+STORAGE_RESUMABLE_THRESHOLD = int(os.environ.get('STORAGE_RESUMABLE_THRESHOLD', 8 * 1024 * 1024))
+STORAGE_CHUNK_SIZE = int(os.environ.get('STORAGE_CHUNK_SIZE', 4 * 1024 * 1024))
+STORAGE_TIMEOUT = float(os.environ.get('STORAGE_TIMEOUT', 60))
+
+
+class Uploader:
+    # Upload ke bucket Firebase. ACL dan Cache-Control ikut dalam upload (tanpa make_public()
+    # terpisah), dengan checksum CRC32C. Objek di atas resumable_threshold dikirim per chunk.
+    # submit() menjalankan upload di pool, jadi original bisa terkirim sambil anotasi dirender
+
+    def __init__(self, bucket, workers=4, public=STORAGE_PUBLIC, cache_control=STORAGE_CACHE_CONTROL,
+                 resumable_threshold=STORAGE_RESUMABLE_THRESHOLD, chunk_size=STORAGE_CHUNK_SIZE, timeout=STORAGE_TIMEOUT):
+        # bucket: callable yang mengembalikan bucket, client dibuat saat pertama dipakai
+        self.bucket = bucket
+        self.public = public
+        self.cache_control = cache_control
+        self.resumable_threshold = resumable_threshold
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Storage")
+        self._lock = threading.Lock()
+        self.uploaded = 0
+        self.failed = 0
+        self.bytes = 0
+
+    def upload(self, source, name, content_type=None):
+        # source: bytes objek, atau path file di spool
+        try:
+            size = os.path.getsize(source) if isinstance(source, str) else len(source)
+            blob = self.bucket().blob(name)
+            if self.cache_control:
+                blob.cache_control = self.cache_control
+            if size > self.resumable_threshold:
+                blob.chunk_size = self.chunk_size
+            options = {"checksum": "crc32c", "timeout": self.timeout}
+            if self.public:
+                options["predefined_acl"] = "publicRead"
+            with timed('firebase_upload'):
+                if isinstance(source, str):
+                    blob.upload_from_filename(source, content_type=content_type, **options)
+                else:
+                    blob.upload_from_string(source, content_type=content_type, **options)
+        except Exception as e:
+            logging.error(f"Error uploading {name} to Firebase Storage: {str(e)}")
+            with self._lock:
+                self.failed += 1
+            return None
+        with self._lock:
+            self.uploaded += 1
+            self.bytes += size
+        logging.info(f"Uploaded {name} ({size} bytes) to Firebase Storage")
+        return blob.public_url
+
+    def submit(self, source, name, content_type=None):
+        # Future berisi URL publik, atau None kalau upload gagal
+        return self._executor.submit(self.upload, source, name, content_type)
+
+    def stats(self):
+        with self._lock:
+            return {"uploaded": self.uploaded, "failed": self.failed, "bytes": self.bytes}
+
+
+class LocalBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.path = bucket.root / name
+        self.cache_control = None
+        self.chunk_size = None
+
+    @property
+    def public_url(self):
+        return self.path.resolve().as_uri()
+
+    def upload_from_string(self, data, content_type=None, **kwargs):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        partial = self.path.with_name(self.path.name + '.part')
+        partial.write_bytes(data)
+        os.replace(partial, self.path)
+        with self.bucket.lock:
+            self.bucket.objects[self.name] = {
+                "size": len(data),
+                "content_type": content_type,
+                "cache_control": self.cache_control,
+                **kwargs,
+            }
+
+    def upload_from_filename(self, filename, content_type=None, **kwargs):
+        with open(filename, 'rb') as f:
+            self.upload_from_string(f.read(), content_type=content_type, **kwargs)
+
+    def make_public(self):
+        pass
+
+
+class LocalBucket:
+    # Pengganti bucket Firebase yang menulis ke direktori lokal (FIREBASE_LOCAL_BUCKET), untuk
+    # test dan run offline; objects mencatat metadata tiap upload
+
+    def __init__(self, root):
+        self.root = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.objects = {}
+        self.lock = threading.Lock()
+
+    def blob(self, name):
+        return LocalBlob(self, name)
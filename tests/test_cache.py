@@ -0,0 +1,48 @@
+import pytest
+
+from cache import ResultCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('cache.time.monotonic', lambda: now[0])
+    return now
+
+
+def test_exact_hits_and_ttl(clock):
+    cache = ResultCache(ttl=10)
+    cache.put("key", {"status": True})
+
+    assert cache.get("key") == {"status": True}
+    clock[0] += 11
+    assert cache.get("key") is None
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    cache = ResultCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_similar_frames_match_only_within_their_scope(clock):
+    cache = ResultCache(perceptual=True, max_distance=2)
+    cache.put("a", "machine-a result", phash=0b1111, scope=("a", None))
+
+    assert cache.get_similar(0b1110, scope=("a", None)) == "machine-a result"
+    assert cache.get_similar(0b1110, scope=("b", None)) is None
+    assert cache.get_similar(0b1110, scope=("a", (0.1, 0.1, 0.5, 0.5))) is None
+    assert cache.get_similar(0b0000, scope=("a", None)) is None
+
+
+def test_perceptual_matching_can_be_disabled(clock):
+    cache = ResultCache(perceptual=False)
+    cache.put("a", 1, phash=0b1111, scope=None)
+
+    assert cache.get_similar(0b1111) is None
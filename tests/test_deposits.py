@@ -0,0 +1,121 @@
+import os
+import time
+
+import pytest
+
+from deposits import Deposit, DepositStore
+from workers import QueueFullError
+
+
+def bottle(box, confidence=0.9):
+    return {"class": "bottle", "box": box, "confidence": confidence}
+
+
+def add(deposit, *bottles):
+    deposit.add(("frame.jpg", b"jpeg", (640, 480)), bool(bottles), 0.01, list(bottles))
+
+
+def test_bottle_is_decided_once_one_track_reaches_consensus():
+    deposit = Deposit(consensus=2, max_frames=5)
+    add(deposit, bottle([10, 10, 50, 50]))
+    assert deposit.verdict is None
+
+    add(deposit, bottle([12, 11, 52, 50], 0.95))
+
+    assert deposit.verdict is True
+    assert deposit.tracks[0].hits == 2
+    assert deposit.best[1][0]["confidence"] == 0.95
+
+
+def test_detections_that_do_not_overlap_start_new_tracks():
+    deposit = Deposit(consensus=2, max_frames=5)
+    add(deposit, bottle([0, 0, 20, 20]))
+    add(deposit, bottle([100, 100, 140, 140]))
+
+    assert len(deposit.tracks) == 2
+    assert deposit.verdict is None
+
+
+def test_empty_frames_do_not_close_a_deposit_early():
+    deposit = Deposit(consensus=2, max_frames=5)
+    add(deposit)
+    add(deposit)
+    add(deposit)
+    assert deposit.verdict is None
+
+    add(deposit, bottle([10, 10, 50, 50]))
+    add(deposit, bottle([10, 10, 50, 50]))
+
+    assert deposit.verdict is True
+
+
+def test_without_consensus_the_majority_decides_at_max_frames():
+    deposit = Deposit(consensus=3, max_frames=3)
+    add(deposit, bottle([0, 0, 20, 20]))
+    add(deposit)
+    add(deposit)
+
+    assert deposit.verdict is False
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DepositStore(str(tmp_path / 'deposits'), ttl=60, max_open=2, check_interval=0, consensus=2, max_frames=5)
+
+
+def test_sessions_persist_state_and_frames_for_other_processes(store, tmp_path):
+    deposit_id = store.open("m1").id
+    with store.session(deposit_id) as deposit:
+        deposit.add(("a.jpg", memoryview(b"best-frame"), (640, 480)), True, 0.01, [bottle([10, 10, 50, 50])])
+
+    other = DepositStore(store.directory, ttl=60)
+    with other.session(deposit_id) as deposit:
+        assert deposit.machine_id == "m1"
+        assert deposit.tracks[0].hits == 1
+        assert deposit.best[0][0] == "a.jpg"
+        assert other.frame_bytes(deposit, 'best') == b"best-frame"
+
+
+def test_failed_session_leaves_the_stored_state_unchanged(store):
+    deposit_id = store.open().id
+
+    with pytest.raises(RuntimeError):
+        with store.session(deposit_id) as deposit:
+            deposit.skip()
+            raise RuntimeError("queue full")
+
+    assert store.get(deposit_id).frames == 0
+
+
+def test_closed_deposits_are_removed(store):
+    deposit_id = store.open().id
+    with store.session(deposit_id) as deposit:
+        deposit.closed = True
+
+    with store.session(deposit_id) as deposit:
+        assert deposit is None
+    assert store.stats()["open"] == 0
+
+
+def test_unknown_ids_are_not_found(store):
+    with store.session("../../etc") as deposit:
+        assert deposit is None
+    assert store.get("0" * 32) is None
+
+
+def test_open_deposits_are_capped(store):
+    store.open()
+    store.open()
+
+    with pytest.raises(QueueFullError):
+        store.open()
+
+
+def test_idle_deposits_expire(store):
+    deposit_id = store.open().id
+    old = time.time() - 120
+    os.utime(os.path.join(store.directory, deposit_id, 'state.json'), (old, old))
+
+    assert store.get(deposit_id) is None
+    store.open()
+    assert store.stats()["expired"] == 1
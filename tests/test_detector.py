@@ -0,0 +1,13 @@
+import pytest
+
+import detector
+
+
+def test_detection_classes_are_parsed():
+    assert detector.parse_classes(' bottle, person ,') == ['bottle', 'person']
+
+
+@pytest.mark.parametrize("spec", ["botle", "bottle,cup", "", " , "])
+def test_invalid_detection_classes_are_rejected(spec):
+    with pytest.raises(ValueError):
+        detector.parse_classes(spec)
@@ -0,0 +1,85 @@
+import io
+
+import pytest
+
+from ingest import BufferPool, IngestError, PooledUpload
+from workers import QueueFullError
+
+JPEG = b'\xff\xd8\xff\xe0' + b'\x00' * 60
+
+
+def test_buffers_are_sized_in_powers_of_two_and_reused():
+    pool = BufferPool(max_bytes=64, min_buffer=8)
+    buffer = pool.acquire(20)
+    assert len(buffer) == 32
+    pool.release(buffer)
+
+    assert pool.acquire(10) is buffer
+    assert pool.stats()["allocated"] == 1
+    assert pool.stats()["reused"] == 1
+
+
+def test_idle_buffers_are_dropped_to_stay_under_the_cap():
+    pool = BufferPool(max_bytes=64, min_buffer=8)
+    pool.release(pool.acquire(32))
+
+    buffer = pool.acquire(64)
+
+    assert len(buffer) == 64
+    assert pool.stats()["idle"] == 0
+
+
+def test_acquire_raises_when_buffers_in_use_hold_the_cap():
+    pool = BufferPool(max_bytes=64, min_buffer=8)
+    pool.acquire(64)
+
+    with pytest.raises(QueueFullError):
+        pool.acquire(8)
+    assert pool.stats()["rejected"] == 1
+
+
+def test_raw_body_is_read_into_one_buffer_and_released_on_close():
+    pool = BufferPool(max_bytes=1024, min_buffer=16)
+    upload = PooledUpload(pool, limit=512, expected_size=16)
+
+    upload.read_from(io.BytesIO(JPEG), chunk_size=10)
+
+    assert bytes(upload.view()) == JPEG
+    assert upload.image_type == '.jpg'
+    upload.close()
+    assert pool.stats()["in_use"] == 0
+
+
+def test_multipart_writes_are_checked_as_they_arrive():
+    pool = BufferPool(max_bytes=1024, min_buffer=16)
+    upload = PooledUpload(pool, limit=512)
+    upload.write(JPEG[:4])
+    upload.write(JPEG[4:])
+    upload.seek(0)
+
+    assert upload.read() == JPEG
+
+    upload = PooledUpload(pool, limit=512)
+    with pytest.raises(IngestError) as error:
+        upload.write(b'GIF89a' + b'\x00' * 10)
+    assert error.value.status == 415
+
+
+def test_uploads_over_the_limit_are_rejected():
+    pool = BufferPool(max_bytes=1024, min_buffer=16)
+    upload = PooledUpload(pool, limit=32)
+
+    with pytest.raises(IngestError) as error:
+        upload.read_from(io.BytesIO(JPEG))
+    assert error.value.status == 413
+
+
+def test_empty_and_short_bodies_are_rejected():
+    pool = BufferPool(max_bytes=1024, min_buffer=16)
+
+    with pytest.raises(IngestError) as error:
+        PooledUpload(pool, limit=32).read_from(io.BytesIO(b''))
+    assert error.value.status == 400
+    with pytest.raises(IngestError) as error:
+        PooledUpload(pool, limit=32).read_from(io.BytesIO(b'abc'))
+    assert error.value.status == 415
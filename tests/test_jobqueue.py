@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+from jobqueue import JobQueue
+
+
+@pytest.fixture
+def jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr('jobqueue.random.uniform', lambda low, high: 1.0)
+    return JobQueue(str(tmp_path / 'jobs.db'), max_attempts=3, base_delay=10, max_delay=15, lease=60)
+
+
+def row(jobs, job_id):
+    return jobs._conn.execute("SELECT status, attempts, next_attempt, last_error FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def failing(job_id, payload):
+    raise RuntimeError("upstream down")
+
+
+def test_completed_jobs_are_removed(jobs):
+    seen = []
+    jobs.register('upload', lambda job_id, payload: seen.append(payload))
+    job_id = jobs.enqueue('upload', {"name": "a.jpg"})
+
+    assert jobs.run() is True
+    assert seen == [{"name": "a.jpg"}]
+    assert row(jobs, job_id) is None
+    assert jobs.run() is False
+
+
+def test_failures_back_off_exponentially_up_to_max_delay(jobs):
+    jobs.register('upload', failing)
+    job_id = jobs.enqueue('upload', {})
+
+    delays = []
+    for _ in range(2):
+        before = time.time()
+        assert jobs.run(job_id) is True
+        status, attempts, next_attempt, error = row(jobs, job_id)
+        assert status == 'pending' and error == "upstream down"
+        delays.append(round(next_attempt - before))
+    assert delays == [10, 15]
+    assert jobs.run() is False
+
+
+def test_jobs_are_dead_after_max_attempts(jobs):
+    jobs.register('upload', failing)
+    job_id = jobs.enqueue('upload', {"original_path": "x"})
+    for _ in range(3):
+        jobs.run(job_id)
+
+    assert row(jobs, job_id)[:2] == ('dead', 3)
+    assert jobs.payloads('upload', 'dead') == [{"original_path": "x"}]
+    assert jobs.payloads('upload', 'pending') == []
+    assert jobs.stats()["dead"] == 1
+
+
+def test_expired_leases_are_reclaimed(jobs, tmp_path):
+    # Proses lain mati saat menjalankan job: lease-nya habis, job diambil ulang
+    crashed = JobQueue(jobs.path, lease=0.05)
+    job_id = jobs.enqueue('upload', {})
+    assert crashed._claim() is not None
+    assert jobs._claim() is None
+
+    time.sleep(0.1)
+
+    assert jobs._claim()[0] == job_id
+
+
+def test_checkpoints_survive_a_retry(jobs):
+    attempts = []
+
+    def handler(job_id, payload):
+        attempts.append(dict(payload))
+        jobs.update_payload(job_id, original_url="https://example/original")
+        if len(attempts) == 1:
+            raise RuntimeError("annotated upload failed")
+
+    jobs.register('upload', handler)
+    job_id = jobs.enqueue('upload', {"name": "a.jpg"})
+    jobs.run(job_id)
+    jobs._conn.execute("UPDATE jobs SET next_attempt = 0 WHERE id = ?", (job_id,))
+    jobs.run()
+
+    assert attempts[1] == {"name": "a.jpg", "original_url": "https://example/original"}
+    assert row(jobs, job_id) is None
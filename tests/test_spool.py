@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from spool import SpoolManager
+from workers import QueueFullError
+
+
+def make_spool(tmp_path, live=(), dead=(), **options):
+    return SpoolManager(str(tmp_path / 'spool'), max_bytes=100, max_files=3,
+                        live_paths=lambda: live, dead_paths=lambda: dead, **options)
+
+
+def test_files_of_pending_jobs_are_never_evicted(tmp_path):
+    live = []
+    spool = make_spool(tmp_path, live)
+    live += [spool.write('a', b'x' * 40), spool.write('b', b'x' * 40)]
+
+    with pytest.raises(QueueFullError):
+        spool.write('c', b'x' * 40)
+
+    assert all(os.path.exists(path) for path in live)
+    assert spool.stats()["rejected"] == 1
+    assert spool.stats()["evicted"] == 0
+
+
+def test_files_of_dead_jobs_make_room(tmp_path):
+    live, dead = [], []
+    spool = make_spool(tmp_path, live, dead)
+    live.append(spool.write('a', b'x' * 40))
+    dead.append(spool.write('b', b'x' * 40))
+    live.append(dead[0])
+
+    path = spool.write('c', b'x' * 40)
+
+    assert os.path.exists(path) and os.path.exists(live[0])
+    assert not os.path.exists(dead[0])
+    assert spool.stats()["evicted"] == 1
+
+
+def test_old_orphans_are_evicted_but_fresh_ones_are_kept(tmp_path):
+    spool = make_spool(tmp_path, orphan_age=0)
+    first = spool.write('a', b'x' * 60)
+    second = spool.write('b', b'x' * 30)
+
+    spool.write('c', b'x' * 30)
+
+    assert not os.path.exists(first)
+    assert os.path.exists(second)
+    # Orphan yang lebih muda dari orphan_age mungkin sedang diklaim job yang baru dicatat
+    spool = make_spool(tmp_path / 'fresh', orphan_age=300)
+    spool.write('a', b'x' * 60)
+    with pytest.raises(QueueFullError):
+        spool.write('b', b'x' * 60)
+
+
+def test_file_count_is_capped(tmp_path):
+    live = []
+    spool = make_spool(tmp_path, live)
+    live += [spool.write(name, b'x') for name in 'abc']
+
+    with pytest.raises(QueueFullError):
+        spool.write('d', b'x')
+
+
+def test_writes_larger_than_the_spool_are_rejected(tmp_path):
+    spool = make_spool(tmp_path)
+
+    with pytest.raises(QueueFullError):
+        spool.write('a', b'x' * 101)
+    assert os.listdir(tmp_path / 'spool') == []
+
+
+def test_collect_keeps_files_of_dead_jobs(tmp_path):
+    live, dead = [], []
+    spool = make_spool(tmp_path, live, dead, orphan_age=0)
+    dead.append(spool.write('a', b'x'))
+    live.append(dead[0])
+    orphan = spool.write('b', b'x')
+
+    assert spool.collect() == 1
+    assert os.path.exists(dead[0]) and not os.path.exists(orphan)
@@ -0,0 +1,50 @@
+from storage import LocalBucket, Uploader
+
+
+class FailingBucket(LocalBucket):
+    def blob(self, name):
+        raise ConnectionError("bucket unreachable")
+
+
+def test_upload_sends_acl_checksum_and_cache_control(tmp_path):
+    bucket = LocalBucket(tmp_path)
+    uploader = Uploader(lambda: bucket, cache_control='public, max-age=60')
+
+    url = uploader.upload(b'original', 'vending/original/a.jpg', 'image/jpeg')
+
+    assert url == (tmp_path / 'vending/original/a.jpg').resolve().as_uri()
+    assert (tmp_path / 'vending/original/a.jpg').read_bytes() == b'original'
+    meta = bucket.objects['vending/original/a.jpg']
+    assert meta["content_type"] == 'image/jpeg'
+    assert meta["cache_control"] == 'public, max-age=60'
+    assert meta["checksum"] == 'crc32c'
+    assert meta["predefined_acl"] == 'publicRead'
+    assert uploader.stats() == {"uploaded": 1, "failed": 0, "bytes": len(b'original')}
+
+
+def test_private_uploads_send_no_acl(tmp_path):
+    bucket = LocalBucket(tmp_path)
+    uploader = Uploader(lambda: bucket, public=False)
+
+    uploader.upload(b'annotated', 'vending/label/a.jpg')
+
+    assert 'predefined_acl' not in bucket.objects['vending/label/a.jpg']
+
+
+def test_failed_uploads_return_none(tmp_path):
+    uploader = Uploader(lambda: FailingBucket(tmp_path))
+
+    assert uploader.upload(b'original', 'a.jpg') is None
+    assert uploader.submit(b'annotated', 'b.jpg').result() is None
+    assert uploader.stats()["failed"] == 2
+
+
+def test_upload_reads_spooled_files(tmp_path):
+    bucket = LocalBucket(tmp_path / 'bucket')
+    spooled = tmp_path / 'spooled.jpg'
+    spooled.write_bytes(b'x' * 1024)
+    uploader = Uploader(lambda: bucket, resumable_threshold=512)
+
+    assert uploader.upload(str(spooled), 'vending/original/a.jpg', 'image/jpeg') is not None
+    assert (tmp_path / 'bucket/vending/original/a.jpg').read_bytes() == b'x' * 1024
+    assert bucket.objects['vending/original/a.jpg']["size"] == 1024
@@ -0,0 +1,51 @@
+import pytest
+
+import tiling
+from decode import reduction_factor
+
+
+@pytest.mark.parametrize("length,count,overlap", [(300, 1, 0.2), (1000, 2, 0.2), (1001, 3, 0.25), (640, 4, 0.0)])
+def test_spans_cover_the_length_with_the_requested_overlap(length, count, overlap):
+    spans = tiling._spans(length, count, overlap)
+
+    assert len(spans) == count
+    assert spans[0][0] == 0
+    assert spans[-1][0] + spans[-1][1] == length
+    for (start, size), (next_start, _) in zip(spans, spans[1:]):
+        assert next_start <= start + size
+        assert abs((start + size - next_start) - overlap * size) <= 1
+
+
+def test_tile_fraction_matches_the_tile_size():
+    width, height = tiling.tile_fraction([(1, 1), (2, 2)], overlap=0.2)
+    start, size = tiling._spans(1000, 2, 0.2)[0]
+
+    assert abs(width * 1000 - size) <= 1
+    assert tiling.tile_fraction([]) == (1.0, 1.0)
+
+
+def test_tile_regions_cover_every_level():
+    regions = tiling.tile_regions(100, 80, [(1, 1), (2, 2)], overlap=0.0)
+
+    assert regions[0] == (0, 0, 100, 80)
+    assert regions[1:] == [(0, 0, 50, 40), (50, 0, 50, 40), (0, 40, 50, 40), (50, 40, 50, 40)]
+
+
+@pytest.mark.parametrize("spec", ["2", "0x2", "ax2"])
+def test_invalid_grids_are_rejected(spec):
+    with pytest.raises(ValueError):
+        tiling.parse_grids(spec)
+
+
+@pytest.mark.parametrize("overlap", [-0.1, 1, 1.5])
+def test_invalid_overlap_is_rejected(overlap):
+    with pytest.raises(ValueError):
+        tiling.tile_regions(100, 100, [(2, 2)], overlap)
+
+
+def test_reduction_keeps_the_inference_region_above_min_side():
+    assert reduction_factor((4000, 3000), 300) == 8
+    # ROI 0.3 x 0.5 dari 4000x3000: sisi terpendek ~900 piksel
+    assert reduction_factor((4000, 3000), 300, (0.3, 0.5)) == 2
+    assert reduction_factor((640, 480), 300, (0.5, 0.5)) == 1
+    assert reduction_factor(None, 300) == 1
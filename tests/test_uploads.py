@@ -0,0 +1,129 @@
+import os
+import signal
+import sys
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from annotations import Annotation
+from storage import LocalBucket
+
+
+@pytest.fixture(scope='module')
+def main(tmp_path_factory):
+    # main.py membaca konfigurasi saat di-import dan langsung menjalankan thread latar belakang
+    root = tmp_path_factory.mktemp('app')
+    previous_sigterm = signal.getsignal(signal.SIGTERM)
+    with pytest.MonkeyPatch.context() as env:
+        env.setenv('FIREBASE_LOCAL_BUCKET', str(root / 'bucket'))
+        env.setenv('JOB_QUEUE_PATH', str(root / 'jobs.db'))
+        env.setenv('SPOOL_DIR', str(root / 'spool'))
+        env.setenv('ANNOTATION_DIR', str(root / 'annotations'))
+        env.setenv('DEPOSIT_DIR', str(root / 'deposits'))
+        env.setenv('ROI_CONFIG_PATH', str(root / 'roi.json'))
+        env.setenv('CASCADE_REFERENCE_DIR', str(root / 'cascade'))
+        import main
+        yield main
+    main.jobs.stop()
+    main.spool.stop()
+    main.annotations.stop()
+    main.upload_pool.shutdown(wait=True, timeout=5)
+    signal.signal(signal.SIGTERM, previous_sigterm)
+    sys.modules.pop('main', None)
+
+
+class FailingBucket(LocalBucket):
+    # Upload objek yang namanya diawali `failing` selalu raise
+    def __init__(self, root, failing):
+        super().__init__(root)
+        self.failing = failing
+
+    def blob(self, name):
+        blob = super().blob(name)
+        if name.startswith(self.failing):
+            def fail(*args, **kwargs):
+                raise ConnectionError("upload failed")
+            blob.upload_from_string = blob.upload_from_filename = fail
+        return blob
+
+
+class BarrierBucket(LocalBucket):
+    # Tiap upload menunggu sampai `parties` upload berjalan bersamaan
+    def __init__(self, root, parties):
+        super().__init__(root)
+        self.barrier = threading.Barrier(parties, timeout=5)
+
+    def blob(self, name):
+        # upload_from_filename juga lewat upload_from_string
+        blob = super().blob(name)
+        upload = blob.upload_from_string
+
+        def upload_together(*args, **kwargs):
+            self.barrier.wait()
+            upload(*args, **kwargs)
+
+        blob.upload_from_string = upload_together
+        return blob
+
+
+def record_upload(main, name):
+    frame = np.full((120, 160, 3), 80, np.uint8)
+    bottles = [{"class": "bottle", "confidence": 0.9, "box": [10, 10, 60, 90]}]
+    annotation = Annotation(cv2.imencode('.jpg', frame)[1].tobytes(), (160, 120), bottles)
+    meta = {
+        "original_name": name,
+        "annotated_name": f"annotated_{name}",
+        "percentage": 90,
+        "content_type": annotation.content_type,
+    }
+    return main.record_upload(annotation, meta)
+
+
+def job_payload(main, name):
+    return next(payload for payload in main.jobs.payloads('upload') if payload["original_name"] == name)
+
+
+def test_retry_uploads_only_the_side_that_failed(main, tmp_path, monkeypatch):
+    notified = []
+    monkeypatch.setattr(main, 'submit_job', notified.append)
+    job_id = record_upload(main, 'retry.jpg')
+
+    monkeypatch.setattr(main.uploader, 'bucket', lambda: FailingBucket(tmp_path, 'vending/label/'))
+    with pytest.raises(RuntimeError):
+        main.background_task(job_id, job_payload(main, 'retry.jpg'))
+
+    payload = job_payload(main, 'retry.jpg')
+    assert payload["original_url"] == (tmp_path / 'vending/original/retry.jpg').resolve().as_uri()
+    assert payload["annotated_url"] is None
+    assert os.path.exists(payload["original_path"])
+    assert notified == []
+
+    # Original sudah ada di bucket: kalau di-upload lagi, job-nya gagal
+    bucket = FailingBucket(tmp_path, 'vending/original/')
+    monkeypatch.setattr(main.uploader, 'bucket', lambda: bucket)
+    main.background_task(job_id, payload)
+
+    assert list(bucket.objects) == ['vending/label/90_annotated_retry.jpg']
+    annotated = cv2.imread(str(tmp_path / 'vending/label/90_annotated_retry.jpg'))
+    assert annotated.shape == (120, 160, 3)
+    payload = job_payload(main, 'retry.jpg')
+    assert payload["annotated_url"] == (tmp_path / 'vending/label/90_annotated_retry.jpg').resolve().as_uri()
+    assert payload["notify_job"] == notified[0]
+    assert not os.path.exists(payload["original_path"])
+
+
+def test_original_and_annotated_upload_in_parallel(main, tmp_path, monkeypatch):
+    notified = []
+    monkeypatch.setattr(main, 'submit_job', notified.append)
+    bucket = BarrierBucket(tmp_path, parties=2)
+    monkeypatch.setattr(main.uploader, 'bucket', lambda: bucket)
+    job_id = record_upload(main, 'parallel.jpg')
+
+    main.background_task(job_id, job_payload(main, 'parallel.jpg'))
+
+    assert sorted(bucket.objects) == ['vending/label/90_annotated_parallel.jpg', 'vending/original/parallel.jpg']
+    assert bucket.objects['vending/original/parallel.jpg']["predefined_acl"] == 'publicRead'
+    assert bucket.objects['vending/label/90_annotated_parallel.jpg']["content_type"] == 'image/jpeg'
+    assert len(notified) == 1
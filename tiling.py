@@ -0,0 +1,67 @@
+import os
+
+# Contoh: "1x1,2x2" = seluruh frame + 4 tile yang saling overlap (piramida 2 level).
+# Kosong = mode biasa, satu input per frame
+DETECTION_TILES = os.environ.get('DETECTION_TILES', '')
+TILE_OVERLAP = float(os.environ.get('DETECTION_TILE_OVERLAP', 0.2))
+
+
+def parse_grids(spec):
+    grids = []
+    for item in spec.split(','):
+        item = item.strip().lower()
+        if not item:
+            continue
+        try:
+            cols, rows = (int(value) for value in item.split('x'))
+        except ValueError:
+            raise ValueError(f"Invalid tile grid '{item}', expected COLSxROWS such as 2x2")
+        if cols < 1 or rows < 1:
+            raise ValueError(f"Invalid tile grid '{item}', both sides must be at least 1")
+        grids.append((cols, rows))
+    return grids
+
+
+def check_overlap(overlap):
+    # overlap >= 1 membuat step tile nol/negatif, overlap < 0 menyisakan celah antar tile
+    if not 0 <= overlap < 1:
+        raise ValueError(f"Invalid tile overlap {overlap}, expected a fraction with 0 <= overlap < 1")
+    return overlap
+
+
+def _spans(length, count, overlap):
+    # count potongan sama besar sepanjang length, tetangga berbagi `overlap` dari satu potongan
+    if count == 1:
+        return [(0, length)]
+    size = length / (count - (count - 1) * overlap)
+    step = size * (1 - overlap)
+    spans = []
+    for i in range(count):
+        start = int(round(i * step))
+        end = length if i == count - 1 else min(length, int(round(i * step + size)))
+        spans.append((start, max(1, end - start)))
+    return spans
+
+
+def tile_fraction(grids, overlap=TILE_OVERLAP):
+    # (lebar, tinggi) tile terkecil sebagai pecahan frame, sesuai ukuran di _spans
+    if not grids:
+        return 1.0, 1.0
+    cols = max(cols for cols, _ in grids)
+    rows = max(rows for _, rows in grids)
+    return 1 / (cols - (cols - 1) * overlap), 1 / (rows - (rows - 1) * overlap)
+
+
+def tile_regions(width, height, grids, overlap=TILE_OVERLAP):
+    # (x, y, width, height) dalam piksel untuk tiap tile di tiap level grid
+    check_overlap(overlap)
+    regions = []
+    for cols, rows in grids:
+        for y, tile_height in _spans(height, rows, overlap):
+            for x, tile_width in _spans(width, cols, overlap):
+                regions.append((x, y, tile_width, tile_height))
+    return regions
+
+
+grids = parse_grids(DETECTION_TILES)
+check_overlap(TILE_OVERLAP)
@@ -0,0 +1,131 @@
+import atexit
+import logging
+import queue
+import signal
+import threading
+import time
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class WorkerPool:
+    # Thread worker tetap dengan antrean terbatas. submit() tidak pernah menunggu: antrean
+    # penuh atau pool sedang drain -> QueueFullError, supaya pemanggil bisa menolak beban
+
+    def __init__(self, max_workers=3, max_queue=100, name="Worker"):
+        self.max_workers = max_workers
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._closing = False
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.max_workers):
+                thread = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _reject(self, reason):
+        with self._lock:
+            self.rejected += 1
+        raise QueueFullError(reason)
+
+    def ensure_capacity(self):
+        # Supaya pemanggil bisa menolak lebih awal, sebelum kerja berat dimulai
+        if self._closing:
+            self._reject(f"{self.name} pool is shutting down")
+        if self._queue.full():
+            self._reject(f"{self.name} queue is full ({self._queue.maxsize} tasks)")
+
+    def submit(self, fn, *args, **kwargs):
+        if self._closing:
+            self._reject(f"{self.name} pool is shutting down")
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((fn, args, kwargs))
+        except queue.Full:
+            self._reject(f"{self.name} queue is full ({self._queue.maxsize} tasks)")
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            try:
+                fn, args, kwargs = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._closing:
+                    return
+                continue
+
+            with self._lock:
+                self.active += 1
+            try:
+                fn(*args, **kwargs)
+                with self._lock:
+                    self.completed += 1
+            except Exception as e:
+                logging.error(f"Error in {self.name} task: {str(e)}")
+                with self._lock:
+                    self.failed += 1
+            finally:
+                with self._lock:
+                    self.active -= 1
+                self._queue.task_done()
+
+    def shutdown(self, wait=True, timeout=None):
+        # Berhenti menerima tugas baru; worker keluar setelah antrean kosong
+        self._closing = True
+        if not wait:
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            thread.join(remaining)
+        if self._queue.qsize() or self.active:
+            logging.warning(f"{self.name} pool stopped with {self._queue.qsize()} queued and {self.active} running tasks")
+        else:
+            logging.info(f"{self.name} pool drained")
+
+    def install_shutdown_handlers(self, drain_timeout=25):
+        # Drain saat SIGTERM (worker gunicorn di-recycle) dan saat interpreter keluar;
+        # handler yang terpasang sebelumnya tetap dipanggil
+        atexit.register(self.shutdown, wait=True, timeout=drain_timeout)
+        if threading.current_thread() is not threading.main_thread():
+            return
+        previous = signal.getsignal(signal.SIGTERM)
+
+        def handle_sigterm(signum, frame):
+            logging.info(f"SIGTERM received, draining {self.name} pool ({self.queue_depth()} queued)")
+            self.shutdown(wait=False)
+            if callable(previous):
+                previous(signum, frame)
+            elif previous == signal.SIG_DFL:
+                raise SystemExit(0)
+
+        signal.signal(signal.SIGTERM, handle_sigterm)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "queue_depth": self._queue.qsize(),
+                "queue_size": self._queue.maxsize,
+                "active": self.active,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "closing": self._closing,
+            }